@@ -0,0 +1,171 @@
+# admission.py
+"""
+Admission control for the analysis endpoints.
+
+Without a bound, every kiosk request queues inside the worker until the
+frontend gives up, and the server keeps analysing frames nobody is waiting
+for. The controller admits at most max_in_flight analyses at once and lets
+at most max_queued more wait for a slot. Waiting requests are admitted
+round-robin across clients, so one kiosk sending a burst cannot starve the
+others. Requests beyond the queue, beyond a client's share, or that waited
+longer than max_queue_wait are refused at once with a Retry-After estimate.
+Only clients that identify themselves (by session id) have a per-client
+share; anonymous requests share one round-robin turn but no limit, since
+kiosks behind one proxy or NAT would otherwise share a single address's
+share.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+
+class ServerOverloaded(Exception):
+    """A request was refused by admission control"""
+
+    def __init__(self, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"Server is busy ({reason.replace('_', ' ')}), retry in {retry_after}s")
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """
+    Bounded, per-client fair admission for concurrent analyses
+
+    in_flight, the per-client counts and the waiting queues are only changed
+    by admit() and _release(), and nothing awaits between checking a count
+    and updating it, so no lock is needed. Cancelling a waiting or running
+    request (e.g. because its client disconnected) frees its queue entry or
+    slot.
+    """
+
+    ANONYMOUS = ""  # Round-robin key shared by requests without a client id
+
+    def __init__(self, max_in_flight: int, max_queued: int, max_per_client: int, max_queue_wait: float):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.max_per_client = max_per_client
+        self.max_queue_wait = max_queue_wait
+        self.in_flight = 0
+        self._clients: Dict[str, int] = {}  # Running plus waiting requests per client
+        self._waiting: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+        self._service_time = 1.0  # Moving average of seconds an admitted request holds its slot
+        self.admitted = 0
+        self.rejected = {"queue_full": 0, "client_limit": 0, "queue_timeout": 0}
+        self.cancelled = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(waiters) for waiters in self._waiting.values())
+
+    def retry_after(self) -> int:
+        """Seconds until the current queue has probably drained"""
+        backlog = self.in_flight + self.queued + 1
+        return max(1, math.ceil(self._service_time * backlog / max(1, self.max_in_flight)))
+
+    def _refuse(self, reason: str, status_code: int) -> ServerOverloaded:
+        self.rejected[reason] += 1
+        return ServerOverloaded(reason, status_code, self.retry_after())
+
+    @asynccontextmanager
+    async def admit(self, client: Optional[str]) -> AsyncIterator[None]:
+        """
+        Hold one analysis slot for client while the block runs
+
+        Args:
+            client (str): Id of the calling client, or None for an anonymous
+                request, which is not subject to max_per_client
+
+        Raises:
+            ServerOverloaded: 429 when the client already has its share of
+                slots and queue entries, 503 when the queue is full or the
+                wait exceeded max_queue_wait
+        """
+        if client is None:
+            client = self.ANONYMOUS
+        elif self._clients.get(client, 0) >= self.max_per_client:
+            raise self._refuse("client_limit", 429)
+
+        self._clients[client] = self._clients.get(client, 0) + 1
+        try:
+            if self.in_flight < self.max_in_flight and not self._waiting:
+                self.in_flight += 1
+            elif self.queued >= self.max_queued:
+                raise self._refuse("queue_full", 503)
+            else:
+                await self._wait_for_slot(client)
+        except BaseException:
+            self._leave(client)
+            raise
+
+        self.admitted += 1
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._service_time = 0.8 * self._service_time + 0.2 * (time.perf_counter() - start_time)
+            self._leave(client)
+            self._release()
+
+    def _leave(self, client: str) -> None:
+        self._clients[client] -= 1
+        if not self._clients[client]:
+            del self._clients[client]
+
+    async def _wait_for_slot(self, client: str) -> None:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(client, deque()).append(future)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.max_queue_wait)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the wait ended; pass it on
+                self._release()
+            else:
+                future.cancel()
+                self._forget(client, future)
+            if isinstance(e, asyncio.CancelledError):
+                self.cancelled += 1
+                raise
+            raise self._refuse("queue_timeout", 503)
+
+    def _forget(self, client: str, future: asyncio.Future) -> None:
+        waiters = self._waiting.get(client)
+        if waiters and future in waiters:
+            waiters.remove(future)
+            if not waiters:
+                del self._waiting[client]
+
+    def _release(self) -> None:
+        """Free a slot and hand it to the next client in round-robin order"""
+        self.in_flight -= 1
+        while self._waiting:
+            client, waiters = next(iter(self._waiting.items()))
+            future = waiters.popleft()
+            if waiters:
+                self._waiting.move_to_end(client)
+            else:
+                del self._waiting[client]
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+                return
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "max_queued": self.max_queued,
+            "max_per_client": self.max_per_client,
+            "max_queue_wait_seconds": self.max_queue_wait,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "waiting_clients": len(self._waiting),
+            "admitted": self.admitted,
+            "rejected": dict(self.rejected),
+            "cancelled": self.cancelled,
+            "average_service_seconds": round(self._service_time, 3),
+        }
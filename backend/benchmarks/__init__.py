@@ -0,0 +1,2 @@
+# Benchmarks for the face recognition server. Run from the backend directory,
+# e.g. `python -m benchmarks.index_recall`.
@@ -0,0 +1,239 @@
+# benchmarks/api_load.py
+"""
+Throughput and latency report for the HTTP API.
+
+Drives each endpoint with a fixed number of concurrent clients and reports
+requests per second and p50/p95/p99 latency at every gallery size. The
+server runs either in-process behind an ASGI transport, with a fresh data
+directory and no network, or is a running server reached over HTTP.
+Analysis requests use the sample photos under public/known_faces plus
+synthetic frames of several sizes. The gallery is grown between rounds
+through the batch enrollment endpoint with copies of the sample photos.
+
+In-process the server answers analyses with fixed mock data
+(HAPPY_MOCK_INFERENCE) unless --no-mock is given, so the HTTP, decoding,
+storage and encryption overhead is measured reproducibly without
+TensorFlow. Start a server with HAPPY_MOCK_INFERENCE=true to do the same
+over HTTP. People enrolled over HTTP are deleted again afterwards. A real
+server may answer repeated frames from its frame cache; in-process the
+cache is disabled unless --frame-cache is given. Every simulated client
+sends its own stable session_id, as the kiosk frontend does. Requests the
+server refuses with 429 (per-client limit) are counted separately from
+other errors, and the run fails if any occur, since the latencies of a
+throttled run are meaningless.
+
+Requires httpx.
+
+Usage (from the backend directory):
+    python -m benchmarks.api_load --sizes 0 100 1000 --requests 200 --concurrency 8
+    python -m benchmarks.api_load --url http://localhost:8000 --sizes 0 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import cv2
+import httpx
+import numpy as np
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+SYNTHETIC_SIZES = [(320, 240), (640, 480), (1280, 720)]
+ENROLL_CHUNK = 100  # People per batch enrollment request while growing the gallery
+
+
+def load_photos(root: Path) -> List[bytes]:
+    """Encoded bytes of every sample photo under root"""
+    return [path.read_bytes() for path in sorted(root.rglob("*")) if path.suffix.lower() in IMAGE_SUFFIXES]
+
+
+def synthetic_frames(count: int, rng: np.random.Generator) -> List[bytes]:
+    """JPEG frames of smooth gradients plus noise, in the sizes cameras usually send"""
+    frames = []
+    for i in range(count):
+        width, height = SYNTHETIC_SIZES[i % len(SYNTHETIC_SIZES)]
+        gradient = np.linspace(0, 255, width, dtype=np.float32)[np.newaxis, :, np.newaxis]
+        img = gradient + rng.normal(0, 25, (height, width, 3))
+        frames.append(cv2.imencode(".jpg", np.clip(img, 0, 255).astype(np.uint8))[1].tobytes())
+    return frames
+
+
+async def drive(count: int, concurrency: int, send: Callable[[int, str], Awaitable[httpx.Response]]) -> Dict:
+    """Send count requests from concurrency clients, each with its own session id, and time every one"""
+    latencies = []
+    errors = 0
+    throttled = 0
+    indices = iter(range(count))
+
+    async def client(session_id: str) -> None:
+        nonlocal errors, throttled
+        for i in indices:
+            start = time.perf_counter()
+            response = await send(i, session_id)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code == 429:
+                throttled += 1
+            elif response.status_code >= 400:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(f"bench-client-{uuid.uuid4().hex[:8]}") for _ in range(concurrency)])
+    wall_seconds = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": count,
+        "errors": errors,
+        "throttled": throttled,
+        "throughput": count / wall_seconds,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+async def grow_gallery(client: httpx.AsyncClient, names: List[str], target: int, photos: List[bytes]) -> None:
+    """Enroll generated people until the benchmark has added target of them"""
+    while len(names) < target:
+        chunk = [f"bench-{uuid.uuid4().hex[:8]}" for _ in range(min(ENROLL_CHUNK, target - len(names)))]
+        files = [("files", (f"{name}.jpg", photos[i % len(photos)], "image/jpeg")) for i, name in enumerate(chunk)]
+        response = await client.post("/add-known-faces/batch", files=files, data={"names": chunk}, timeout=600)
+        result = response.json()
+        if response.status_code >= 400 or result.get("failed"):
+            raise SystemExit(f"Enrolling the benchmark gallery failed: {result}")
+        names.extend(chunk)
+
+
+async def remove_people(client: httpx.AsyncClient, names: List[str]) -> None:
+    for name in names:
+        await client.delete(f"/known-faces/{name}")
+
+
+async def run_round(client: httpx.AsyncClient, frames: List[bytes], photo: bytes,
+                    count: int, concurrency: int) -> Dict[str, Dict]:
+    """Benchmark every endpoint once at the current gallery size"""
+    results = {}
+    results["GET /"] = await drive(count, concurrency, lambda i, session_id: client.get("/"))
+    results["GET /health"] = await drive(count, concurrency, lambda i, session_id: client.get("/health"))
+    results["POST /analyze-face"] = await drive(count, concurrency, lambda i, session_id: client.post(
+        "/analyze-face", files={"file": ("frame.jpg", frames[i % len(frames)], "image/jpeg")},
+        data={"session_id": session_id}
+    ))
+    results["GET /known-faces?limit=50"] = await drive(
+        count, concurrency, lambda i, session_id: client.get("/known-faces", params={"limit": 50}))
+    results["GET /known-faces?count_only"] = await drive(
+        count, concurrency, lambda i, session_id: client.get("/known-faces", params={"count_only": "true"}))
+
+    # Enroll and then delete the same probe people, so the gallery size is unchanged afterwards
+    probes = [f"bench-probe-{uuid.uuid4().hex[:8]}" for _ in range(count)]
+    results["POST /add-known-face"] = await drive(count, concurrency, lambda i, session_id: client.post(
+        "/add-known-face", files={"file": ("probe.jpg", photo, "image/jpeg")}, data={"name": probes[i]}
+    ))
+    results["DELETE /known-faces/{name}"] = await drive(
+        count, concurrency, lambda i, session_id: client.delete(f"/known-faces/{probes[i]}"))
+    return results
+
+
+def print_round(size: int, results: Dict[str, Dict]) -> None:
+    print(f"Gallery size {size}")
+    print(f"{'endpoint':<32}{'requests':>10}{'errors':>8}{'429s':>8}{'req/s':>10}"
+          f"{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, result in results.items():
+        print(f"{endpoint:<32}{result['requests']:>10}{result['errors']:>8}{result['throttled']:>8}"
+              f"{result['throughput']:>10.1f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}")
+    print()
+
+
+async def benchmark(client: httpx.AsyncClient, args: argparse.Namespace, photos: List[bytes],
+                    frames: List[bytes]) -> Dict[int, Dict[str, Dict]]:
+    info = (await client.get("/")).json()
+    print(f"Server at {client.base_url}, DeepFace available: {info.get('deepface_available')}, "
+          f"{args.requests} requests per endpoint, concurrency {args.concurrency}\n")
+
+    enrolled: List[str] = []
+    report = {}
+    try:
+        for size in sorted(args.sizes):
+            await grow_gallery(client, enrolled, size, photos)
+            report[size] = await run_round(client, frames, photos[0], args.requests, args.concurrency)
+            print_round(size, report[size])
+    finally:
+        if args.url:
+            await remove_people(client, enrolled)
+    return report
+
+
+async def run_in_process(args: argparse.Namespace, photos: List[bytes],
+                         frames: List[bytes]) -> Dict[int, Dict[str, Dict]]:
+    """Start the app in this process with its data directory in a temporary folder"""
+    with tempfile.TemporaryDirectory(prefix="api_load_") as data_root:
+        # The server keeps its data relative to the working directory and reads its settings on import
+        os.chdir(data_root)
+        if args.mock:
+            os.environ["HAPPY_MOCK_INFERENCE"] = "true"
+        import server
+
+        if not args.frame_cache:
+            server.frame_cache.max_entries = 0
+        await server.warm_up_server()
+        if not server.startup_state["ready"]:
+            raise SystemExit(f"Server warm-up failed: {server.startup_state['error']}")
+
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://in-process", timeout=60) as client:
+            return await benchmark(client, args, photos, frames)
+
+
+async def run_over_http(args: argparse.Namespace, photos: List[bytes],
+                        frames: List[bytes]) -> Dict[int, Dict[str, Dict]]:
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        return await benchmark(client, args, photos, frames)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="Benchmark a running server instead of starting one in-process")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[0, 100, 1000], help="Gallery sizes to measure at")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per endpoint and gallery size")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients")
+    parser.add_argument("--images", type=Path, default=Path("../public/known_faces"))
+    parser.add_argument("--synthetic", type=int, default=30, help="Synthetic frames mixed into the analysis requests")
+    parser.add_argument("--no-mock", dest="mock", action="store_false",
+                        help="In-process, run the real models instead of the deterministic mock")
+    parser.add_argument("--frame-cache", action="store_true", help="In-process, keep the near-duplicate frame cache on")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=Path, help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    # Resolve paths before the in-process server changes the working directory
+    photos = load_photos(args.images)
+    if not photos:
+        raise SystemExit(f"No images found under {args.images}")
+    frames = photos + synthetic_frames(args.synthetic, np.random.default_rng(args.seed))
+    output: Optional[Path] = args.json.resolve() if args.json else None
+
+    runner = run_over_http if args.url else run_in_process
+    report = asyncio.run(runner(args, photos, frames))
+
+    if output:
+        output.write_text(json.dumps({
+            "target": args.url or "in-process",
+            "mock": args.mock if not args.url else None,
+            "concurrency": args.concurrency,
+            "seed": args.seed,
+            "results": {str(size): results for size, results in report.items()},
+        }, indent=2))
+
+    throttled = sum(result["throttled"] for results in report.values() for result in results.values())
+    if throttled:
+        raise SystemExit(f"{throttled} requests were refused with 429; the latencies above are not meaningful. "
+                         f"Lower --concurrency or raise ANALYSIS_MAX_PER_CLIENT on the server")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# benchmarks/detection_resolution.py
+"""
+Accuracy-vs-speed report for detection at reduced resolution.
+
+Runs every detector over a set of face photos at full resolution and at each
+MAX_DETECTION_DIMENSION candidate, and compares the downscaled runs against
+the full-resolution ones: how often the face is still found, how well the
+mapped-back box overlaps the full-resolution box, and how long detection
+took. Photos can be upscaled first to mimic large camera uploads.
+
+Requires DeepFace and TensorFlow.
+
+Usage (from the backend directory):
+    python -m benchmarks.detection_resolution --images ../public/known_faces --upscale 4
+"""
+import argparse
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import cv2
+import numpy as np
+
+import inference
+from face_tracking import iou
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+
+def load_images(root: Path, upscale: float, limit: int) -> List[np.ndarray]:
+    """Every photo under root, optionally enlarged to simulate high-resolution uploads"""
+    images = []
+    for path in sorted(root.rglob("*")):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        img = cv2.imread(str(path))
+        if img is None:
+            continue
+        if upscale != 1.0:
+            img = cv2.resize(img, None, fx=upscale, fy=upscale, interpolation=cv2.INTER_CUBIC)
+        images.append(img)
+        if len(images) == limit:
+            break
+    return images
+
+
+def run_detector(backend: str, images: List[np.ndarray], max_dimension: int) -> Dict:
+    """Detect on every image and time each call"""
+    latencies = []
+    results = []
+    for img in images:
+        start = time.perf_counter()
+        result = inference.extract_face(img, backend, max_dimension)
+        latencies.append(time.perf_counter() - start)
+        results.append(result)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "results": results,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=Path, default=Path("../public/known_faces"))
+    parser.add_argument("--backends", nargs="+", default=inference.DETECTOR_BACKENDS)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[1280, 960, 640, 480, 320])
+    parser.add_argument("--upscale", type=float, default=1.0, help="Enlarge every photo by this factor first")
+    parser.add_argument("--limit", type=int, default=50, help="Most photos to use")
+    args = parser.parse_args()
+
+    if not inference.load_deepface():
+        raise SystemExit("DeepFace is not available; this benchmark needs the real detectors")
+
+    images = load_images(args.images, args.upscale, args.limit)
+    if not images:
+        raise SystemExit(f"No images found under {args.images}")
+
+    inference.prepare_models(args.backends)
+    sizes = [f"{img.shape[1]}x{img.shape[0]}" for img in images]
+    print(f"{len(images)} images ({sizes[0]}{' and others' if len(set(sizes)) > 1 else ''})\n")
+
+    for backend in args.backends:
+        full = run_detector(backend, images, 0)
+        print(f"Detector {backend}")
+        print(f"{'max dim':<10}{'found':>8}{'agree':>8}{'mean IoU':>10}{'p50 ms':>10}{'p95 ms':>10}")
+        found = sum(r["detected"] for r in full["results"])
+        print(f"{'full':<10}{found:>8}{1.0:>8.3f}{1.0:>10.3f}{full['p50_ms']:>10.1f}{full['p95_ms']:>10.1f}")
+
+        for dimension in args.dimensions:
+            scaled = run_detector(backend, images, dimension)
+            found = sum(r["detected"] for r in scaled["results"])
+            agree = np.mean([a["detected"] == b["detected"] for a, b in zip(full["results"], scaled["results"])])
+            overlaps = [
+                iou(a["region"], b["region"])
+                for a, b in zip(full["results"], scaled["results"])
+                if a["detected"] and b["detected"]
+            ]
+            mean_iou = float(np.mean(overlaps)) if overlaps else float("nan")
+            print(f"{dimension:<10}{found:>8}{agree:>8.3f}{mean_iou:>10.3f}"
+                  f"{scaled['p50_ms']:>10.1f}{scaled['p95_ms']:>10.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+# benchmarks/import_time.py
+"""
+Import-time report for the server and CLI modules.
+
+Imports each module in a fresh interpreter several times and reports the
+median wall time, the slowest imports underneath it (from python -X
+importtime) and whether TensorFlow or DeepFace were pulled in. Those should
+only be imported by the model warm-up, so importing the server stays fast.
+Exits non-zero when a module exceeds --budget or imports TensorFlow, so it
+can run as a check. The imports run in a scratch directory, because
+importing the server creates its data directory, log file and (without
+HAPPY_ENCRYPTION_KEY) a new key relative to the working directory.
+
+Usage (from the backend directory):
+    python -m benchmarks.import_time --modules server bulk_import --runs 5 --budget 2.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+HEAVY_MODULES = ("tensorflow", "deepface")
+
+PROBE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(elapsed, *[name for name in {heavy!r} if name in sys.modules])
+"""
+
+
+def run_python(args: List[str], workdir: str) -> subprocess.CompletedProcess:
+    """Run a fresh interpreter in workdir with the backend modules importable"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(BACKEND_DIR), os.getenv("PYTHONPATH")])))
+    return subprocess.run([sys.executable, *args], cwd=workdir, env=env, capture_output=True, text=True, check=True)
+
+
+def time_import(module: str, workdir: str) -> Tuple[float, List[str]]:
+    """Seconds to import module in a fresh interpreter, and the heavy modules it loaded"""
+    output = run_python(["-c", PROBE.format(module=module, heavy=HEAVY_MODULES)], workdir).stdout.split()
+    return float(output[0]), output[1:]
+
+
+def slowest_imports(module: str, count: int, workdir: str) -> List[Tuple[float, str]]:
+    """(cumulative seconds, module) of the slowest imports below module, from -X importtime"""
+    stderr = run_python(["-X", "importtime", "-c", f"import {module}"], workdir).stderr
+
+    timings: Dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        timings[name] = max(timings.get(name, 0.0), int(cumulative) / 1e6)
+    timings.pop(module, None)
+    return sorted(((seconds, name) for name, seconds in timings.items()), reverse=True)[:count]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modules", nargs="+", default=["server", "bulk_import"])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="Slowest dependencies to list per module")
+    parser.add_argument("--budget", type=float, help="Fail when a module takes longer than this many seconds")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory(prefix="import_time_") as workdir:
+        for module in args.modules:
+            runs = [time_import(module, workdir) for _ in range(args.runs)]
+            median = statistics.median(seconds for seconds, _ in runs)
+            heavy = sorted({name for _, loaded in runs for name in loaded})
+
+            print(f"import {module}: median {median:.3f}s over {args.runs} runs "
+                  f"(min {min(s for s, _ in runs):.3f}s, max {max(s for s, _ in runs):.3f}s)")
+            print(f"  heavy modules imported: {', '.join(heavy) if heavy else 'none'}")
+            for seconds, name in slowest_imports(module, args.top, workdir):
+                print(f"  {seconds:>8.3f}s  {name}")
+            print()
+
+            if heavy or (args.budget is not None and median > args.budget):
+                failed = True
+
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/index_recall.py
+"""
+Recall-vs-latency report for the gallery index backends.
+
+Builds a synthetic gallery of clustered unit vectors (VGG-Face sized by
+default), queries it with noisy copies of enrolled vectors, and compares every
+approximate backend against exact brute-force search.
+
+Usage (from the backend directory):
+    python -m benchmarks.index_recall --sizes 10000 100000 --queries 500
+"""
+import argparse
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from face_index import HNSWLIB_AVAILABLE, create_index
+
+
+def synthetic_gallery(size: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Unit vectors grouped around random centres, like embeddings of similar-looking people"""
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, size)] + 0.6 * rng.standard_normal((size, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def noisy_queries(gallery: np.ndarray, count: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    """Perturbed copies of enrolled vectors, standing in for new photos of known people"""
+    picks = gallery[rng.integers(0, len(gallery), count)]
+    queries = picks + noise * rng.standard_normal(picks.shape).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def run_backend(kind: str, options: Dict, gallery: np.ndarray, queries: np.ndarray) -> Dict:
+    """Build one index and time every query"""
+    index = create_index(kind, **options)
+
+    start = time.perf_counter()
+    for i, vector in enumerate(gallery):
+        index.add(str(i), vector)
+    index.wait_for_training()
+    build_seconds = time.perf_counter() - start
+
+    latencies = []
+    answers = []
+    for query in queries:
+        start = time.perf_counter()
+        result = index.search(query, k=1)
+        latencies.append(time.perf_counter() - start)
+        answers.append(result[0][0] if result else None)
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "build_seconds": build_seconds,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "answers": answers,
+    }
+
+
+def configurations() -> List[Dict]:
+    """Backends and parameter sweeps included in the report"""
+    configs = [{"kind": "ivf", "options": {"nprobe": nprobe}} for nprobe in (1, 4, 8, 16, 32)]
+    if HNSWLIB_AVAILABLE:
+        configs += [{"kind": "hnsw", "options": {"ef_search": ef}} for ef in (16, 64, 256)]
+    return configs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=2622, help="Embedding size (VGG-Face is 2622)")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--clusters", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=0.3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not HNSWLIB_AVAILABLE:
+        print("hnswlib is not installed; skipping the hnsw backend\n")
+
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        gallery = synthetic_gallery(size, args.dim, args.clusters, rng)
+        queries = noisy_queries(gallery, args.queries, args.noise, rng)
+
+        exact = run_backend("exact", {}, gallery, queries)
+        print(f"Gallery size {size}, dim {args.dim}, {args.queries} queries")
+        print(f"{'backend':<10}{'params':<18}{'recall@1':>10}{'p50 ms':>10}{'p99 ms':>10}{'build s':>10}")
+        print(f"{'exact':<10}{'-':<18}{1.0:>10.3f}{exact['p50_ms']:>10.3f}{exact['p99_ms']:>10.3f}"
+              f"{exact['build_seconds']:>10.2f}")
+
+        for config in configurations():
+            result = run_backend(config["kind"], config["options"], gallery, queries)
+            recall = np.mean([a == b for a, b in zip(result["answers"], exact["answers"])])
+            params = ",".join(f"{k}={v}" for k, v in config["options"].items())
+            print(f"{config['kind']:<10}{params:<18}{recall:>10.3f}{result['p50_ms']:>10.3f}"
+                  f"{result['p99_ms']:>10.3f}{result['build_seconds']:>10.2f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# bulk_import.py
+"""
+Offline bulk enrollment of known faces.
+
+Reads a directory tree laid out like public/known_faces (<Name>/*.jpg) and
+enrolls every person, with all of their images as references, through the
+same batch pipeline as the
+/add-known-faces/batch endpoint: detection and embedding run in parallel
+batches, each batch writes its identity mappings in one transaction, and
+failures are reported per file without stopping the run. A running server
+sharing the data directory picks the new faces up automatically.
+
+Usage (from the backend directory, with the server's environment):
+    python bulk_import.py ../public/known_faces --batch-size 64 --report import_report.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import server
+
+logger = logging.getLogger("bulk_import")
+
+
+def collect_images(root: Path) -> Dict[str, List[Tuple[str, Path]]]:
+    """Name -> (relative file name, path) of every image under root/<Name>/"""
+    people = {}
+    for person_dir in sorted(d for d in root.iterdir() if d.is_dir()):
+        images = [
+            (str(path.relative_to(root)), path)
+            for path in sorted(person_dir.iterdir())
+            if path.is_file() and path.suffix.lower() in server.IMAGE_SUFFIXES
+        ]
+        if images:
+            people[person_dir.name] = images
+    return people
+
+
+def batches(people: Dict[str, List[Tuple[str, Path]]], batch_size: int):
+    """Group whole people into batches of about batch_size images, so no person is split"""
+    batch = []
+    for name, images in people.items():
+        batch.extend((name, filename, path) for filename, path in images)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def run(root: Path, batch_size: int, skip_existing: bool) -> dict:
+    # Build the models and load the gallery exactly as the server does at startup
+    await server.warm_up_server()
+    if not server.startup_state["ready"]:
+        raise SystemExit(f"Model warm-up failed: {server.startup_state['error']}")
+
+    people = collect_images(root)
+    if skip_existing:
+        existing = {face["name"] for face in server.face_catalog.page()[0]}
+        people = {name: images for name, images in people.items() if name not in existing}
+    total = sum(len(images) for images in people.values())
+    logger.info(f"Enrolling {total} images of {len(people)} people from {root}")
+
+    report = {"enrolled": [], "failed": []}
+    done = 0
+    for batch in batches(people, batch_size):
+        items = []
+        for name, filename, path in batch:
+            try:
+                items.append((name, filename, path.read_bytes()))
+            except OSError as e:
+                report["failed"].append({"name": name, "file": filename, "error": str(e)})
+
+        result = await server.enroll_batch(items)
+        for key in report:
+            report[key].extend(result[key])
+        done += len(batch)
+        logger.info(f"Processed {done}/{total} images "
+                    f"({len(report['enrolled'])} enrolled, {len(report['failed'])} failed)")
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", type=Path, help="Directory containing one sub-directory of images per person")
+    parser.add_argument("--batch-size", type=int, default=64, help="Images per enrollment batch")
+    parser.add_argument("--skip-existing", action="store_true", help="Skip names that are already enrolled")
+    parser.add_argument("--report", type=Path, help="Write the per-file results to this JSON file")
+    args = parser.parse_args()
+
+    if not args.root.is_dir():
+        raise SystemExit(f"{args.root} is not a directory")
+
+    report = asyncio.run(run(args.root, args.batch_size, args.skip_existing))
+
+    print(f"Enrolled: {len(report['enrolled'])} images, failed: {len(report['failed'])}")
+    for failure in report["failed"]:
+        print(f"  FAILED {failure['file']}: {failure['error']}")
+    if args.report:
+        args.report.write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
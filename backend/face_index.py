@@ -0,0 +1,436 @@
+# face_index.py
+"""
+Vector index backends for the face recognition gallery.
+
+Every index stores unit-length embeddings under a string key and answers
+nearest-neighbour queries by cosine distance (1 - dot product). The exact
+brute-force index is the default; the IVF and HNSW indexes trade a little
+recall for sub-linear search on large galleries.
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import hnswlib
+    HNSWLIB_AVAILABLE = True
+except ImportError:
+    HNSWLIB_AVAILABLE = False
+
+
+def spherical_kmeans(vectors: np.ndarray, k: int, iterations: int = 10,
+                     rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """
+    Cluster unit vectors by cosine similarity
+
+    Args:
+        vectors (np.ndarray): (N, D) unit-length vectors, N >= k
+        k (int): Number of clusters
+        iterations (int): Assignment/update rounds
+        rng (np.random.Generator): Source of the initial centroid choice
+
+    Returns:
+        np.ndarray: (k, D) unit-length centroids
+    """
+    rng = rng or np.random.default_rng(0)
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+
+    for _ in range(iterations):
+        labels = np.argmax(vectors @ centroids.T, axis=1)
+        for c in range(k):
+            members = vectors[labels == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                centroids[c] = centroid / max(np.linalg.norm(centroid), 1e-12)
+    return centroids
+
+
+class _VectorStore:
+    """Growable (N, D) float32 matrix with O(1) append and swap-remove by key"""
+
+    def __init__(self, dim: Optional[int] = None, initial_capacity: int = 64):
+        self.dim = dim
+        self.keys: List[str] = []
+        self.rows: Dict[str, int] = {}
+        self._initial_capacity = initial_capacity
+        self._matrix = np.empty((0, dim or 0), dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.rows
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """View of the occupied rows"""
+        return self._matrix[:len(self.keys)]
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        if key in self.rows:
+            self._matrix[self.rows[key]] = vector
+            return
+
+        if self.dim is None:
+            self.dim = vector.shape[0]
+            self._matrix = np.empty((self._initial_capacity, self.dim), dtype=np.float32)
+        elif len(self.keys) == self._matrix.shape[0]:
+            grown = np.empty((max(self._initial_capacity, 2 * self._matrix.shape[0]), self.dim), dtype=np.float32)
+            grown[:len(self.keys)] = self._matrix[:len(self.keys)]
+            self._matrix = grown
+
+        row = len(self.keys)
+        self._matrix[row] = vector
+        self.keys.append(key)
+        self.rows[key] = row
+
+    def remove(self, key: str) -> bool:
+        row = self.rows.pop(key, None)
+        if row is None:
+            return False
+
+        # Move the last row into the freed slot so the matrix stays dense
+        last = len(self.keys) - 1
+        if row != last:
+            last_key = self.keys[last]
+            self._matrix[row] = self._matrix[last]
+            self.keys[row] = last_key
+            self.rows[last_key] = row
+        self.keys.pop()
+        return True
+
+    def get(self, key: str) -> np.ndarray:
+        return self._matrix[self.rows[key]]
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        if not self.keys:
+            return []
+
+        distances = 1.0 - self.vectors @ query
+        k = min(k, len(distances))
+        if k < len(distances):
+            candidates = np.argpartition(distances, k - 1)[:k]
+        else:
+            candidates = np.arange(len(distances))
+        candidates = candidates[np.argsort(distances[candidates])]
+        return [(self.keys[i], float(distances[i])) for i in candidates]
+
+
+class FaceIndex:
+    """Base class for gallery indexes. Implementations are thread-safe."""
+
+    kind = "base"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        """Insert or replace the vector stored under key"""
+        raise NotImplementedError
+
+    def remove(self, key: str) -> None:
+        """Remove key from the index if it is present"""
+        raise NotImplementedError
+
+    def search(self, query: np.ndarray, k: int = 1) -> List[Tuple[str, float]]:
+        """Return up to k (key, cosine_distance) pairs, closest first"""
+        raise NotImplementedError
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> None:
+        """Block until background maintenance has finished; most indexes have none"""
+
+    def describe(self) -> Dict[str, object]:
+        """Summary of the index configuration for health and stats endpoints"""
+        return {"backend": self.kind, "size": len(self)}
+
+
+class BruteForceIndex(FaceIndex):
+    """Exact search with one matrix-vector product over the whole gallery"""
+
+    kind = "exact"
+
+    def __init__(self):
+        super().__init__()
+        self._store = _VectorStore()
+
+    def __len__(self) -> int:
+        return len(self._store)
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        with self._lock:
+            self._store.add(key, np.asarray(vector, dtype=np.float32))
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._store.remove(key)
+
+    def search(self, query: np.ndarray, k: int = 1) -> List[Tuple[str, float]]:
+        with self._lock:
+            return self._store.search(np.asarray(query, dtype=np.float32), k)
+
+
+class IVFIndex(FaceIndex):
+    """
+    Inverted-file index: vectors are bucketed under their nearest coarse
+    centroid and a query only scans the nprobe closest buckets.
+
+    Below train_threshold vectors the index behaves exactly like brute force.
+    Centroids are (re)trained with spherical k-means whenever the gallery has
+    grown by retrain_factor since the last training; between retrains new
+    vectors are assigned to their nearest existing centroid.
+
+    Training takes seconds on large galleries, so by default it runs in a
+    background thread on a snapshot of the vectors while the current buckets
+    keep answering searches. Changes made meanwhile are replayed onto the new
+    buckets before they are swapped in. The default nprobe reached a recall@1
+    of 0.94 on 10,000 vectors in benchmarks.index_recall (nprobe=8: 0.68).
+    """
+
+    kind = "ivf"
+
+    def __init__(self, nlist: Optional[int] = None, nprobe: int = 32,
+                 train_threshold: int = 2048, retrain_factor: float = 4.0,
+                 kmeans_iterations: int = 10, seed: int = 0, background_training: bool = True):
+        super().__init__()
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_threshold = train_threshold
+        self.retrain_factor = retrain_factor
+        self.kmeans_iterations = kmeans_iterations
+        self.background_training = background_training
+        self._rng = np.random.default_rng(seed)
+
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[_VectorStore] = [_VectorStore()]
+        self._assignment: Dict[str, int] = {}
+        self._trained_size = 0
+        self._training: Optional[threading.Thread] = None
+        self._pending: List[Tuple[str, Optional[np.ndarray]]] = []  # Changes made while training, None for removals
+
+    def __len__(self) -> int:
+        return len(self._assignment)
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remove(key)
+            bucket = self._nearest_bucket(vector)
+            self._lists[bucket].add(key, vector)
+            self._assignment[key] = bucket
+            if self._training is not None:
+                self._pending.append((key, vector))
+
+            size = len(self._assignment)
+            if (self._training is None and size >= self.train_threshold
+                    and size >= self.retrain_factor * max(self._trained_size, 1)):
+                self._start_training()
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+            if self._training is not None:
+                self._pending.append((key, None))
+
+    def wait_for_training(self, timeout: Optional[float] = None) -> None:
+        """Block until a background training run, if any, has swapped in its buckets"""
+        training = self._training
+        if training is not None:
+            training.join(timeout)
+
+    def _remove(self, key: str) -> None:
+        bucket = self._assignment.pop(key, None)
+        if bucket is not None:
+            self._lists[bucket].remove(key)
+
+    def _nearest_bucket(self, vector: np.ndarray) -> int:
+        if self._centroids is None:
+            return 0
+        return int(np.argmax(self._centroids @ vector))
+
+    def _start_training(self) -> None:
+        """Train on a snapshot of every stored vector; called with the lock held"""
+        keys = [key for store in self._lists for key in store.keys]
+        vectors = np.vstack([store.vectors for store in self._lists if len(store)])
+        self._trained_size = len(keys)
+        if not self.background_training:
+            self._swap_in(*self._train(keys, vectors))
+            return
+
+        def train() -> None:
+            trained = None
+            try:
+                trained = self._train(keys, vectors)
+            finally:
+                with self._lock:
+                    if trained is not None:
+                        self._swap_in(*trained)
+                    self._training = None
+
+        self._pending = []
+        self._training = threading.Thread(target=train, name="ivf-training", daemon=True)
+        self._training.start()
+
+    def _train(self, keys: List[str], vectors: np.ndarray) -> Tuple[np.ndarray, List[_VectorStore], Dict[str, int]]:
+        """Centroids, buckets and assignment for the given vectors; needs no lock"""
+        nlist = self.nlist or max(1, int(np.sqrt(len(keys))))
+
+        sample_size = min(len(vectors), 64 * nlist)
+        sample = vectors[self._rng.choice(len(vectors), sample_size, replace=False)]
+        centroids = spherical_kmeans(sample, nlist, self.kmeans_iterations, self._rng)
+
+        lists = [_VectorStore(dim=vectors.shape[1]) for _ in range(nlist)]
+        assignment = {}
+        for key, bucket, vector in zip(keys, np.argmax(vectors @ centroids.T, axis=1), vectors):
+            lists[bucket].add(key, vector)
+            assignment[key] = int(bucket)
+        return centroids, lists, assignment
+
+    def _swap_in(self, centroids: np.ndarray, lists: List[_VectorStore], assignment: Dict[str, int]) -> None:
+        """Replace the buckets with freshly trained ones; called with the lock held"""
+        self._centroids, self._lists, self._assignment = centroids, lists, assignment
+        for key, vector in self._pending:
+            self._remove(key)
+            if vector is not None:
+                bucket = self._nearest_bucket(vector)
+                self._lists[bucket].add(key, vector)
+                self._assignment[key] = bucket
+        self._pending = []
+
+    def search(self, query: np.ndarray, k: int = 1) -> List[Tuple[str, float]]:
+        query = np.asarray(query, dtype=np.float32)
+        with self._lock:
+            if self._centroids is None:
+                return self._lists[0].search(query, k)
+
+            nprobe = min(self.nprobe, len(self._centroids))
+            buckets = np.argpartition(-(self._centroids @ query), nprobe - 1)[:nprobe]
+            results = []
+            for bucket in buckets:
+                results.extend(self._lists[bucket].search(query, k))
+        results.sort(key=lambda item: item[1])
+        return results[:k]
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "backend": self.kind,
+            "size": len(self),
+            "nlist": 0 if self._centroids is None else len(self._centroids),
+            "nprobe": self.nprobe,
+            "training": self._training is not None,
+        }
+
+
+class HNSWIndex(FaceIndex):
+    """
+    Hierarchical navigable small-world graph index backed by hnswlib
+
+    The default ef_search reached a recall@1 of 0.99 on 10,000 vectors in
+    benchmarks.index_recall (ef_search=64: 0.85). hnswlib can only mark
+    elements deleted, so new vectors take over the slots of deleted ones
+    (allow_replace_deleted) and the graph does not keep growing as people
+    are enrolled and removed.
+    """
+
+    kind = "hnsw"
+
+    def __init__(self, m: int = 16, ef_construction: int = 200, ef_search: int = 256,
+                 initial_capacity: int = 1024):
+        if not HNSWLIB_AVAILABLE:
+            raise ImportError("hnswlib is required for the hnsw index backend")
+        super().__init__()
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self._initial_capacity = initial_capacity
+
+        self._index = None
+        self._labels: Dict[str, int] = {}
+        self._keys: Dict[int, str] = {}
+        self._next_label = 0
+        self._deleted = 0  # Slots marked deleted and not yet reused
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def _ensure_index(self, dim: int) -> None:
+        if self._index is None:
+            self._index = hnswlib.Index(space="ip", dim=dim)
+            self._index.init_index(
+                max_elements=self._initial_capacity,
+                ef_construction=self.ef_construction,
+                M=self.m,
+                allow_replace_deleted=True
+            )
+            self._index.set_ef(self.ef_search)
+        elif not self._deleted and self._index.get_current_count() >= self._index.get_max_elements():
+            self._index.resize_index(2 * self._index.get_max_elements())
+
+    def add(self, key: str, vector: np.ndarray) -> None:
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._remove(key)
+            self._ensure_index(vector.shape[0])
+            label = self._next_label
+            self._next_label += 1
+            self._index.add_items(vector.reshape(1, -1), np.array([label]), replace_deleted=self._deleted > 0)
+            self._deleted = max(0, self._deleted - 1)
+            self._labels[key] = label
+            self._keys[label] = key
+
+    def remove(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def _remove(self, key: str) -> None:
+        label = self._labels.pop(key, None)
+        if label is not None:
+            self._index.mark_deleted(label)
+            self._deleted += 1
+            del self._keys[label]
+
+    def search(self, query: np.ndarray, k: int = 1) -> List[Tuple[str, float]]:
+        query = np.asarray(query, dtype=np.float32).reshape(1, -1)
+        with self._lock:
+            k = min(k, len(self._labels))
+            if k == 0:
+                return []
+            labels, distances = self._index.knn_query(query, k=k)
+            # hnswlib's "ip" space already reports 1 - dot product
+            return [(self._keys[int(label)], float(distance))
+                    for label, distance in zip(labels[0], distances[0])]
+
+    def describe(self) -> Dict[str, object]:
+        return {
+            "backend": self.kind,
+            "size": len(self),
+            "m": self.m,
+            "ef_search": self.ef_search,
+            "allocated": 0 if self._index is None else self._index.get_current_count(),
+        }
+
+
+INDEX_BACKENDS = {
+    BruteForceIndex.kind: BruteForceIndex,
+    IVFIndex.kind: IVFIndex,
+    HNSWIndex.kind: HNSWIndex,
+}
+
+
+def create_index(kind: str = "exact", **options) -> FaceIndex:
+    """
+    Build a gallery index by name
+
+    Args:
+        kind (str): One of "exact", "ivf" or "hnsw"
+        **options: Backend-specific tuning parameters
+
+    Returns:
+        FaceIndex: An empty index
+    """
+    if kind not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown face index backend '{kind}'. Choose from {sorted(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[kind](**options)
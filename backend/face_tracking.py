@@ -0,0 +1,223 @@
+# face_tracking.py
+"""
+Per-session face tracking for continuous camera streams.
+
+A kiosk user stands in front of the camera for minutes, so consecutive frames
+almost always show the same person in about the same place. A session keeps
+the last face box and the identity recognised for it; while new boxes overlap
+the track (IoU) and the track's confidence has not decayed, the server skips
+the embedding model and the gallery match and reuses the identity. Confidence
+decays with the time since the identity was last verified, not per frame, so
+at a slow polling rate a different person stepping into the same spot is
+re-identified within seconds. Detection also searches the area around the
+tracked box before the whole frame.
+"""
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+def iou(a: List[int], b: List[int]) -> float:
+    """Intersection over union of two [x, y, w, h] boxes"""
+    ax2, ay2 = a[0] + a[2], a[1] + a[3]
+    bx2, by2 = b[0] + b[2], b[1] + b[3]
+    inter_w = max(0, min(ax2, bx2) - max(a[0], b[0]))
+    inter_h = max(0, min(ay2, by2) - max(a[1], b[1]))
+    intersection = inter_w * inter_h
+    union = a[2] * a[3] + b[2] * b[3] - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def expand_box(box: List[int], margin: float, width: int, height: int) -> List[int]:
+    """Grow an [x, y, w, h] box by margin times its size on every side, clipped to the frame"""
+    x, y, w, h = box
+    dx, dy = int(w * margin), int(h * margin)
+    x1, y1 = max(0, x - dx), max(0, y - dy)
+    x2, y2 = min(width, x + w + dx), min(height, y + h + dy)
+    return [x1, y1, x2 - x1, y2 - y1]
+
+
+class FaceTrack:
+    """The face followed by one session and the identity last recognised for it"""
+
+    def __init__(self, box: List[int], identity_id: Optional[str], person: str, distance: Optional[float]):
+        self.box = box
+        self.identity_id = identity_id
+        self.person = person
+        self.distance = distance
+        self.confidence = 1.0
+        self.identified_at = time.monotonic()
+        self.frames = 1
+
+
+class TrackingSession:
+    """Track state and compute accounting for one camera stream"""
+
+    def __init__(self, session_id: str, iou_threshold: float, confidence_decay: float, min_confidence: float):
+        """confidence_decay is the share of track confidence kept per second since identification"""
+        self.session_id = session_id
+        self.iou_threshold = iou_threshold
+        self.confidence_decay = confidence_decay
+        self.min_confidence = min_confidence
+        self.track: Optional[FaceTrack] = None
+
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+        self.frames = 0
+        self.identifications = 0
+        self.identifications_skipped = 0
+        self.region_detections = 0
+        self._identify_seconds = 0.0
+        self._tracked_seconds = 0.0
+
+    def needs_identification(self, box: Optional[List[int]]) -> bool:
+        """
+        Whether the face at box has to be identified again
+
+        Args:
+            box (list): Detected [x, y, w, h], or None when no face was found
+        """
+        if box is None or self.track is None:
+            return True
+        if iou(self.track.box, box) < self.iou_threshold:
+            return True
+        return self._confidence_now() < self.min_confidence
+
+    def _confidence_now(self) -> float:
+        return self.confidence_decay ** (time.monotonic() - self.track.identified_at)
+
+    def identified(self, box: Optional[List[int]], identity_id: Optional[str], person: str,
+                   distance: Optional[float]) -> None:
+        """Start a new track from a full identification; no box drops the track"""
+        self.track = FaceTrack(box, identity_id, person, distance) if box is not None else None
+
+    def follow(self, box: List[int]) -> FaceTrack:
+        """Move the track to box and decay its confidence by the time since identification"""
+        self.track.box = box
+        self.track.confidence = self._confidence_now()
+        self.track.frames += 1
+        return self.track
+
+    def invalidate(self) -> None:
+        """Forget the tracked identity, e.g. after the gallery changed"""
+        self.track = None
+
+    def touch(self) -> None:
+        """Mark the stream as active, e.g. for a frame answered from the cache"""
+        self.last_seen = time.time()
+
+    def record_frame(self, identified: bool, seconds: float, region_detection: bool) -> None:
+        self.frames += 1
+        self.touch()
+        if region_detection:
+            self.region_detections += 1
+        if identified:
+            self.identifications += 1
+            self._identify_seconds += seconds
+        else:
+            self.identifications_skipped += 1
+            self._tracked_seconds += seconds
+
+    def seconds_saved(self) -> float:
+        """Estimated processing time saved by skipping identification on tracked frames"""
+        if not self.identifications or not self.identifications_skipped:
+            return 0.0
+        mean_identify = self._identify_seconds / self.identifications
+        mean_tracked = self._tracked_seconds / self.identifications_skipped
+        return max(0.0, mean_identify - mean_tracked) * self.identifications_skipped
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "session_id": self.session_id,
+            "frames": self.frames,
+            "identifications": self.identifications,
+            "identifications_skipped": self.identifications_skipped,
+            "region_detections": self.region_detections,
+            "estimated_seconds_saved": round(self.seconds_saved(), 3),
+            "tracking": self.track is not None,
+            "track_confidence": None if self.track is None else round(self.track.confidence, 3),
+            "idle_seconds": round(time.time() - self.last_seen, 1),
+        }
+
+
+class SessionRegistry:
+    """
+    Bounded set of tracking sessions
+
+    Sessions idle for longer than idle_timeout are dropped, and the least
+    recently used session is evicted once max_sessions is reached. The
+    session dict and the tracks are only read and changed by analyze_frame
+    and the stats endpoint, both coroutines. Detection and inference run in
+    the pools and only return boxes, so no other thread reaches this
+    state.
+    """
+
+    def __init__(self, max_sessions: int = 256, idle_timeout: float = 300.0, iou_threshold: float = 0.5,
+                 confidence_decay: float = 0.9, min_confidence: float = 0.5):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.iou_threshold = iou_threshold
+        self.confidence_decay = confidence_decay
+        self.min_confidence = min_confidence
+        self._sessions: "OrderedDict[str, TrackingSession]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def get(self, session_id: Optional[str] = None) -> TrackingSession:
+        """Return the session with this id, creating it (with a new id if none is given)"""
+        self._expire()
+        session_id = session_id or uuid.uuid4().hex
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = TrackingSession(session_id, self.iou_threshold, self.confidence_decay, self.min_confidence)
+            self._sessions[session_id] = session
+            while len(self._sessions) > self.max_sessions:
+                self._evict_oldest()
+        self._sessions.move_to_end(session_id)
+        session.touch()
+        return session
+
+    def close(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.invalidate()
+
+    def invalidate_tracks(self) -> None:
+        """Make every session re-identify its next face"""
+        for session in self._sessions.values():
+            session.invalidate()
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self.idle_timeout
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if oldest.last_seen >= cutoff:
+                break
+            self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        # A stream may still hold the evicted session; its track must not outlive the registry entry
+        _, session = self._sessions.popitem(last=False)
+        session.invalidate()
+
+    def stats(self) -> Dict[str, object]:
+        self._expire()
+        sessions = [session.stats() for session in self._sessions.values()]
+        return {
+            "active_sessions": len(sessions),
+            "policy": {
+                "iou_threshold": self.iou_threshold,
+                "confidence_decay": self.confidence_decay,
+                "min_confidence": self.min_confidence,
+                "idle_timeout": self.idle_timeout,
+            },
+            "totals": {
+                "frames": sum(s["frames"] for s in sessions),
+                "identifications": sum(s["identifications"] for s in sessions),
+                "identifications_skipped": sum(s["identifications_skipped"] for s in sessions),
+                "estimated_seconds_saved": round(sum(s["estimated_seconds_saved"] for s in sessions), 3),
+            },
+            "sessions": sessions,
+        }
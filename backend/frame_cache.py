@@ -0,0 +1,126 @@
+# frame_cache.py
+"""
+Near-duplicate frame cache for the analysis endpoints.
+
+A static kiosk camera sends long runs of practically identical frames. Each
+decoded frame is reduced to a 64-bit difference hash (dHash); when a recent
+frame's hash is within a few bits of it, the earlier analysis result is
+returned instead of running detection and the models again. Results carry a
+person's identity, so every entry belongs to a scope (the caller's session
+and gallery version) and only answers lookups from that same scope.
+"""
+import copy
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+def dhash(img: np.ndarray, hash_size: int = 8) -> int:
+    """
+    Difference hash of a BGR or grayscale image
+
+    The image is shrunk to (hash_size + 1) x hash_size grey pixels and each
+    bit records whether a pixel is brighter than its right neighbour, so the
+    hash survives JPEG noise and small exposure changes.
+    """
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class FrameCache:
+    """
+    LRU cache of analysis results keyed by perceptual hash
+
+    Entries expire after ttl seconds and at most max_entries are kept; entries
+    hold only the JSON result, never the image, so max_entries bounds memory.
+    Lookups scan every entry, which is cheap at the small sizes this is meant
+    for. Only dhash runs on the I/O pool. get, put and clear are called
+    directly from the analysis coroutines, so two threads never touch the
+    entry dict at once.
+    """
+
+    def __init__(self, max_entries: int = 64, ttl: float = 10.0, max_distance: int = 4):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[Tuple[Hashable, int], Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def get(self, frame_hash: int, scope: Hashable = None,
+            accept: Optional[Callable[[Dict[str, Any]], bool]] = None) -> Optional[Tuple[Dict[str, Any], int]]:
+        """
+        Return (a copy of the cached result, hash distance) for the closest
+        recent frame of the same scope within max_distance, or None
+
+        Args:
+            scope: Only consider results stored with an equal scope
+            accept: Only consider cached results for which this returns True
+        """
+        self._expire()
+        best_key, best_distance = None, self.max_distance + 1
+        for key, (_, result) in self._entries.items():
+            if key[0] != scope:
+                continue
+            distance = hamming(key[1], frame_hash)
+            if distance < best_distance and (accept is None or accept(result)):
+                best_key, best_distance = key, distance
+
+        if best_key is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._entries.move_to_end(best_key)
+        return copy.deepcopy(self._entries[best_key][1]), best_distance
+
+    def put(self, frame_hash: int, result: Dict[str, Any], scope: Hashable = None) -> None:
+        if not self.enabled:
+            return
+        key = (scope, frame_hash)
+        self._entries[key] = (time.time() + self.ttl, copy.deepcopy(result))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        """Drop every cached result, e.g. after the gallery changed"""
+        self._entries.clear()
+
+    def _expire(self) -> None:
+        now = time.time()
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, object]:
+        self._expire()
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl,
+            "max_distance": self.max_distance,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,125 @@
+# identity_store.py
+"""
+Durable store for enrolled identities.
+
+Each identity is one row: the random id used for its storage directories, the
+Fernet-encrypted name, a keyed HMAC of the normalized name for lookups by name,
+and enrollment metadata. SQLite in WAL mode gives single-row atomic writes, so
+enrolling or deleting one person no longer rewrites every record, and several
+server processes can share the file.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS identities (
+    id TEXT PRIMARY KEY,
+    encrypted_name TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    name_hmac TEXT
+)
+"""
+
+NAME_INDEX = "CREATE INDEX IF NOT EXISTS identities_name_hmac ON identities (name_hmac)"
+
+
+class IdentityStore:
+    """SQLite-backed id -> encrypted name records, safe to share between threads"""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.execute(SCHEMA)
+            # Stores created before the name index existed lack the column
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(identities)")}
+            if "name_hmac" not in columns:
+                self._conn.execute("ALTER TABLE identities ADD COLUMN name_hmac TEXT")
+            self._conn.execute(NAME_INDEX)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM identities").fetchone()[0]
+
+    def load_mapping(self) -> Dict[str, str]:
+        """Every id -> encrypted name, read in one query"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT id, encrypted_name FROM identities"))
+
+    def get(self, identity_id: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT encrypted_name FROM identities WHERE id = ?", (identity_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def find_by_name_hmac(self, name_hmac: str) -> List[str]:
+        """Ids enrolled under a name, oldest first"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT id FROM identities WHERE name_hmac = ? ORDER BY created_at", (name_hmac,)
+            )]
+
+    def add(self, identity_id: str, encrypted_name: str, name_hmac: Optional[str] = None) -> None:
+        self.add_many([(identity_id, encrypted_name, name_hmac)])
+
+    def add_many(self, records: Iterable[Tuple]) -> None:
+        """Insert (id, encrypted name[, name HMAC]) records in one transaction"""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO identities (id, encrypted_name, created_at, name_hmac) VALUES (?, ?, ?, ?)",
+                [(record[0], record[1], now, record[2] if len(record) > 2 else None) for record in records]
+            )
+
+    def missing_name_hmacs(self) -> List[Tuple[str, str]]:
+        """(id, encrypted name) of every identity without a name HMAC yet"""
+        with self._lock:
+            return list(self._conn.execute("SELECT id, encrypted_name FROM identities WHERE name_hmac IS NULL"))
+
+    def set_name_hmacs(self, records: Iterable[Tuple[str, str]]) -> None:
+        """Store (id, name HMAC) pairs in one transaction"""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE identities SET name_hmac = ? WHERE id = ?",
+                [(name_hmac, identity_id) for identity_id, name_hmac in records]
+            )
+
+    def delete(self, identity_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM identities WHERE id = ?", (identity_id,)).rowcount > 0
+
+    def migrate_from_json(self, mapping_file: str) -> int:
+        """
+        Import the legacy encryption_mapping.json once
+
+        The file is renamed with a .migrated suffix afterwards so the import
+        never runs twice.
+
+        Returns:
+            int: Number of identities imported
+        """
+        if not os.path.exists(mapping_file):
+            return 0
+
+        with open(mapping_file, 'r') as f:
+            mapping = json.load(f)
+        self.add_many(mapping.items())
+        os.replace(mapping_file, mapping_file + ".migrated")
+        logger.info(f"Migrated {len(mapping)} identities from {mapping_file}")
+        return len(mapping)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,430 @@
+# inference.py
+"""
+Model loading and inference helpers for the face recognition server.
+
+DeepFace builds its models lazily inside the first analyze/represent call,
+which makes the first requests after a restart take many seconds. This module
+owns the TensorFlow/DeepFace import and builds every model the endpoints use
+up front, so the server can warm them and only report ready afterwards. The
+import itself is deferred to the warm-up (or the first inference call), so
+importing this module, the server or the CLI tools stays fast.
+"""
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# TensorFlow and DeepFace take many seconds and hundreds of MB to import, so
+# they are imported on first use or by the warm-up (load_deepface), never with
+# this module. Until then availability only says whether they are installed.
+DeepFace = None
+DEEPFACE_AVAILABLE = all(importlib.util.find_spec(name) is not None for name in ("tensorflow", "deepface"))
+_deepface_lock = threading.Lock()
+_deepface_loaded = False
+
+if not DEEPFACE_AVAILABLE:
+    logger.error("DeepFace import failed: tensorflow or deepface is not installed")
+    logger.info("Using mock data for emotion analysis")
+
+
+def _add_compatibility_layer(tf: Any) -> None:
+    """Provide LocallyConnected2D on Keras versions that dropped it; must run before DeepFace is imported"""
+    if hasattr(tf.keras.layers, 'LocallyConnected2D'):
+        return
+    logger.info("Adding LocallyConnected2D compatibility layer")
+
+    # Create a functional placeholder class that mimics the original
+    class LocallyConnected2DPlaceholder:
+        def __init__(self, *args, **kwargs):
+            self.filters = kwargs.get('filters', 32)
+            self.kernel_size = kwargs.get('kernel_size', (3, 3))
+            self.strides = kwargs.get('strides', (1, 1))
+            self.padding = kwargs.get('padding', 'valid')
+            self.activation = kwargs.get('activation', None)
+
+        def __call__(self, inputs):
+            # For models that actually try to use this layer, fall back to Conv2D
+            # This provides similar functionality to keep the model working
+            return tf.keras.layers.Conv2D(
+                filters=self.filters,
+                kernel_size=self.kernel_size,
+                strides=self.strides,
+                padding=self.padding,
+                activation=self.activation
+            )(inputs)
+
+    # Add the placeholder to tf.keras.layers
+    setattr(tf.keras.layers, 'LocallyConnected2D', LocallyConnected2DPlaceholder)
+    logger.info("LocallyConnected2D compatibility layer added successfully")
+
+
+def load_deepface() -> bool:
+    """
+    Import TensorFlow and DeepFace once; safe to call from several threads
+
+    Returns:
+        bool: Whether DeepFace is usable
+    """
+    global DeepFace, DEEPFACE_AVAILABLE, _deepface_loaded
+    if _deepface_loaded:
+        return DEEPFACE_AVAILABLE
+
+    with _deepface_lock:
+        if _deepface_loaded or not DEEPFACE_AVAILABLE:
+            return DEEPFACE_AVAILABLE
+        model_status["deepface"] = "loading"
+        start_time = time.time()
+        try:
+            logger.info("Setting up TensorFlow/Keras compatibility layer...")
+            import tensorflow as tf
+            _add_compatibility_layer(tf)
+
+            # Now try to import DeepFace with our compatibility layer in place
+            from deepface import DeepFace as deepface_module
+            DeepFace = deepface_module
+            model_status["deepface"] = "loaded"
+            logger.info("DeepFace successfully imported with compatibility layer")
+        except Exception as e:
+            DEEPFACE_AVAILABLE = False
+            model_status["deepface"] = "unavailable"
+            logger.error(f"DeepFace import failed: {str(e)}")
+            logger.info("Using mock data for emotion analysis")
+        model_status["import_seconds"] = round(time.time() - start_time, 2)
+        _deepface_loaded = True
+    return DEEPFACE_AVAILABLE
+
+
+# Models used by the endpoints
+EMOTION_MODEL = 'Emotion'
+RECOGNITION_MODEL = 'VGG-Face'  # Embedding model used for person recognition
+DETECTOR_BACKENDS = ['opencv', 'retinaface', 'mtcnn']  # Detectors the endpoints may call
+EMOTION_LABELS = ['angry', 'disgust', 'fear', 'happy', 'sad', 'surprise', 'neutral']  # Emotion model output order
+EMOTION_INPUT_SIZE = (48, 48)
+RECOGNITION_INPUT_SIZE = (224, 224)  # VGG-Face input; smaller crops are upscaled and lose detail
+DETECTION_REFINE_MARGIN = 0.25  # Context kept around a face when re-detecting it at full resolution
+
+# Built models, kept alive for the lifetime of the process
+models: Dict[str, Any] = {}
+
+# Readiness of the models, reported through /health
+model_status: Dict[str, Any] = {
+    "ready": False,
+    "error": None,
+    "deepface": "not_loaded" if DEEPFACE_AVAILABLE else "unavailable",
+    "import_seconds": None,
+    "load_seconds": None,
+    "warmup_seconds": None,
+}
+_load_lock = threading.Lock()
+
+
+def load_models(detector_backends: Optional[List[str]] = None) -> None:
+    """
+    Build the emotion, recognition and face detector models
+
+    DeepFace caches built models internally, so building them here means the
+    analyze/represent calls made by the endpoints reuse these instances.
+
+    Args:
+        detector_backends (list): Detector backends to build, defaults to DETECTOR_BACKENDS
+    """
+    if not load_deepface():
+        return
+
+    from deepface.detectors import FaceDetector
+
+    start_time = time.time()
+    models["emotion"] = DeepFace.build_model(EMOTION_MODEL)
+    models["recognition"] = DeepFace.build_model(RECOGNITION_MODEL)
+
+    for backend in detector_backends or DETECTOR_BACKENDS:
+        try:
+            models[f"detector:{backend}"] = FaceDetector.build_model(backend)
+        except Exception as e:
+            logger.warning(f"Failed to build {backend} detector: {str(e)}")
+
+    model_status["load_seconds"] = round(time.time() - start_time, 2)
+    logger.info(f"Models built in {model_status['load_seconds']}s: {sorted(models)}")
+
+
+def warm_up(detector_backends: Optional[List[str]] = None) -> None:
+    """
+    Run one inference through every model on a synthetic image
+
+    The first prediction of a Keras model traces and allocates its graph, so a
+    warm-up pass keeps that cost out of the first real request.
+    """
+    if not DEEPFACE_AVAILABLE:
+        return
+
+    start_time = time.time()
+    synthetic = np.random.default_rng(0).integers(0, 256, size=(480, 640, 3), dtype=np.uint8)
+
+    face = synthetic
+    for backend in detector_backends or DETECTOR_BACKENDS:
+        if f"detector:{backend}" not in models:
+            continue
+        try:
+            face = extract_face(synthetic, backend)["face"]
+        except Exception as e:
+            logger.warning(f"Warm-up with {backend} failed: {str(e)}")
+
+    # Trace both models for a single face and for a batch
+    predict_faces([(face, True)])
+    predict_faces([(face, True), (face, False)])
+
+    model_status["warmup_seconds"] = round(time.time() - start_time, 2)
+    logger.info(f"Model warm-up finished in {model_status['warmup_seconds']}s")
+
+
+def prepare_models(detector_backends: Optional[List[str]] = None) -> None:
+    """Build and warm every model once; safe to call from several threads"""
+    with _load_lock:
+        if model_status["ready"]:
+            return
+        try:
+            load_models(detector_backends)
+            warm_up(detector_backends)
+            model_status["ready"] = True
+        except Exception as e:
+            model_status["error"] = str(e)
+            logger.error(f"Model preparation failed: {str(e)}")
+            raise
+
+
+def init_worker(detector_backends: Optional[List[str]] = None) -> None:
+    """
+    Initializer for inference worker processes: build and warm the models once
+    so every task routed to this process reuses them
+    """
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s[%(process)d] - %(levelname)s - %(message)s'
+    )
+    prepare_models(detector_backends)
+
+
+def worker_status(hold_seconds: float = 0.0) -> Dict[str, Any]:
+    """
+    Report which process answered and whether its models are ready
+
+    Args:
+        hold_seconds (float): Keep this worker busy for a moment so concurrent
+            status calls are spread across the pool
+    """
+    time.sleep(hold_seconds)
+    return {
+        "pid": os.getpid(),
+        "ready": model_status["ready"],
+        "deepface_available": DEEPFACE_AVAILABLE,
+        "import_seconds": model_status["import_seconds"],
+        "load_seconds": model_status["load_seconds"],
+        "warmup_seconds": model_status["warmup_seconds"],
+    }
+
+
+def get_model(name: str) -> Any:
+    """Return a built model, building it on first use if load_models has not run"""
+    if name not in models:
+        if not load_deepface():
+            raise RuntimeError("DeepFace is not available")
+        if name == "emotion":
+            models[name] = DeepFace.build_model(EMOTION_MODEL)
+        elif name == "recognition":
+            models[name] = DeepFace.build_model(RECOGNITION_MODEL)
+        else:
+            from deepface.detectors import FaceDetector
+            models[name] = FaceDetector.build_model(name.split(":", 1)[1])
+    return models[name]
+
+
+def _resize_with_padding(img: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
+    """Resize keeping the aspect ratio and pad to target_size, as DeepFace's preprocessing does"""
+    factor = min(target_size[0] / img.shape[0], target_size[1] / img.shape[1])
+    resized = cv2.resize(img, (max(1, int(img.shape[1] * factor)), max(1, int(img.shape[0] * factor))))
+
+    diff_0 = target_size[0] - resized.shape[0]
+    diff_1 = target_size[1] - resized.shape[1]
+    padding = [(diff_0 // 2, diff_0 - diff_0 // 2), (diff_1 // 2, diff_1 - diff_1 // 2)]
+    if resized.ndim == 3:
+        padding.append((0, 0))
+    padded = np.pad(resized, padding, 'constant')
+
+    if padded.shape[:2] != tuple(target_size):
+        padded = cv2.resize(padded, (target_size[1], target_size[0]))
+    return padded
+
+
+def downscale_for_detection(img: np.ndarray, max_dimension: Optional[int]) -> Tuple[np.ndarray, float]:
+    """
+    Shrink an image so its longest side is at most max_dimension
+
+    Returns:
+        tuple: (image to run the detector on, scale factor from the original)
+    """
+    height, width = img.shape[:2]
+    if not max_dimension or max(height, width) <= max_dimension:
+        return img, 1.0
+
+    scale = max_dimension / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_AREA), scale
+
+
+def _detect(img: np.ndarray, detector_backend: str) -> List[Tuple[np.ndarray, List[int]]]:
+    """Aligned crops and [x, y, w, h] boxes of every face the detector finds"""
+    # Building the detector imports DeepFace first, with the compatibility layer
+    detector = get_model(f"detector:{detector_backend}")
+    from deepface.detectors import FaceDetector
+
+    return [
+        (face, [int(v) for v in region])
+        for face, region in FaceDetector.detect_faces(detector, detector_backend, img, align=True)
+        if face is not None and face.size > 0
+    ]
+
+
+def _full_resolution_crop(img: np.ndarray, region: List[int], detector_backend: str) -> Tuple[np.ndarray, List[int]]:
+    """
+    Aligned full-resolution crop for a box found on a downscaled copy
+
+    The detector runs again on just the area around the box, which is small
+    and cheap, so the crop is aligned exactly as a full-frame detection would
+    be. If it misses, the plain (unaligned) box is cropped instead.
+    """
+    height, width = img.shape[:2]
+    x, y, w, h = region
+    dx, dy = int(w * DETECTION_REFINE_MARGIN), int(h * DETECTION_REFINE_MARGIN)
+    x1, y1 = max(0, x - dx), max(0, y - dy)
+    x2, y2 = min(width, x + w + dx), min(height, y + h + dy)
+
+    refined = _detect(img[y1:y2, x1:x2], detector_backend)
+    if refined:
+        face, (rx, ry, rw, rh) = max(refined, key=lambda item: item[1][2] * item[1][3])
+        return face, [rx + x1, ry + y1, rw, rh]
+
+    x, y = max(0, x), max(0, y)
+    return img[y:min(height, y + h), x:min(width, x + w)], region
+
+
+def extract_face(image: Any, detector_backend: str, max_dimension: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Detect and align every face in an image
+
+    This is the only detection stage: its aligned crop feeds both the emotion
+    model and the embedding model, and its boxes are reported to clients.
+
+    Detector cost grows with the number of pixels while the models only use a
+    small face crop, so with max_dimension set the detector runs on a
+    downscaled copy and the boxes are mapped back to full resolution. When the
+    largest face's crop from the downscaled copy is smaller than the
+    recognition model's input, a second, small detector pass around its box
+    at full resolution produces the crop instead, trading some of the single
+    pass's savings for recognition accuracy on distant faces.
+
+    Args:
+        image: Path to the image, or a BGR image array
+        detector_backend (str): Face detector to use
+        max_dimension (int): Longest side to run the detector at; None or 0 for full resolution
+
+    Returns:
+        dict: "face" (aligned BGR crop of the largest face, or the whole image
+        when no face was found), "region" ([x, y, w, h] of that face),
+        "regions" (boxes of every detected face), "detected" and "detector"
+    """
+    img = cv2.imread(image) if isinstance(image, str) else image
+    if img is None:
+        raise ValueError("Could not read image for face detection")
+
+    small, scale = downscale_for_detection(img, max_dimension)
+    faces = _detect(small, detector_backend)
+    if scale != 1.0:
+        faces = [(face, [int(round(v / scale)) for v in region]) for face, region in faces]
+
+    if faces:
+        face, region = max(faces, key=lambda item: item[1][2] * item[1][3])
+        if scale != 1.0 and min(face.shape[:2]) < min(RECOGNITION_INPUT_SIZE):
+            face, region = _full_resolution_crop(img, region, detector_backend)
+    else:
+        # Same behaviour as DeepFace with enforce_detection=False: analyse the whole frame
+        face, region = img, [0, 0, img.shape[1], img.shape[0]]
+
+    return {
+        "face": face,
+        "region": region,
+        "regions": [region for _, region in faces],
+        "detected": bool(faces),
+        "detector": detector_backend,
+    }
+
+
+def predict_faces(requests: List[Tuple[np.ndarray, bool]]) -> List[Dict[str, Any]]:
+    """
+    Run the emotion model, and the embedding model where requested, over a batch of faces
+
+    Each model is called once for the whole batch rather than once per face.
+
+    Args:
+        requests (list): (aligned BGR face crop, whether an embedding is needed) pairs
+
+    Returns:
+        list: One dict per request with "emotion" scores (percentages),
+        "dominant_emotion" and "embedding" (unit-length, or None)
+    """
+    emotion_batch = np.stack([
+        _resize_with_padding(cv2.cvtColor(face, cv2.COLOR_BGR2GRAY), EMOTION_INPUT_SIZE)[..., np.newaxis]
+        for face, _ in requests
+    ]).astype(np.float32) / 255
+    predictions = np.asarray(get_model("emotion")(emotion_batch, training=False))
+
+    results = []
+    for prediction in predictions:
+        scores = 100 * prediction / prediction.sum()
+        results.append({
+            "emotion": {label: float(score) for label, score in zip(EMOTION_LABELS, scores)},
+            "dominant_emotion": EMOTION_LABELS[int(np.argmax(scores))],
+            "embedding": None,
+        })
+
+    wanted = [i for i, (_, needs_embedding) in enumerate(requests) if needs_embedding]
+    if wanted:
+        recognition_model = get_model("recognition")
+        input_size = tuple(recognition_model.input_shape[1:3])
+        recognition_batch = np.stack([
+            _resize_with_padding(requests[i][0], input_size) for i in wanted
+        ]).astype(np.float32) / 255
+        embeddings = np.asarray(recognition_model(recognition_batch, training=False), dtype=np.float32)
+        embeddings /= np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        for i, embedding in zip(wanted, embeddings):
+            results[i]["embedding"] = embedding
+
+    return results
+
+
+def compute_embedding(image: Any, detector_backend: str = 'retinaface') -> np.ndarray:
+    """
+    Compute the L2-normalized recognition embedding for the face in an image
+
+    Uses the same detection and preprocessing as the batched analysis path so
+    enrolled and probe embeddings are comparable.
+
+    Args:
+        image: Path to the image, or a BGR image array
+        detector_backend (str): Face detector to use, falling back to opencv if it fails
+
+    Returns:
+        np.ndarray: A unit-length float32 vector of shape (D,)
+    """
+    try:
+        face = extract_face(image, detector_backend)["face"]
+    except Exception as e:
+        logger.warning(f"{detector_backend} detection failed, falling back to opencv: {str(e)}")
+        face = extract_face(image, 'opencv')["face"]
+    return predict_faces([(face, True)])[0]["embedding"]
@@ -1,19 +1,30 @@
 # Import necessary libraries for our face recognition server
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form, BackgroundTasks
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, WebSocket, WebSocketDisconnect, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 import numpy as np
 import cv2
 import os
 import uvicorn
+import asyncio
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import logging
 import time
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, List, Optional, Tuple
-import tempfile
 import shutil
-import json
+import zipfile
+import tarfile
+import hashlib
+import hmac
+import unicodedata
+import random
+import bisect
+from collections import OrderedDict, deque
 
 # Import encryption-related libraries
 from cryptography.fernet import Fernet
@@ -34,51 +45,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# ===== TensorFlow/Keras Compatibility Layer =====
-# This must be done before importing DeepFace to fix dependency issues
-try:
-    logger.info("Setting up TensorFlow/Keras compatibility layer...")
-    import tensorflow as tf
-    import sys
-    
-    # Check if we need to add LocallyConnected2D for compatibility
-    if not hasattr(tf.keras.layers, 'LocallyConnected2D'):
-        logger.info("Adding LocallyConnected2D compatibility layer")
-        
-        # Create a functional placeholder class that mimics the original
-        class LocallyConnected2DPlaceholder:
-            def __init__(self, *args, **kwargs):
-                self.filters = kwargs.get('filters', 32)
-                self.kernel_size = kwargs.get('kernel_size', (3, 3))
-                self.strides = kwargs.get('strides', (1, 1))
-                self.padding = kwargs.get('padding', 'valid')
-                self.activation = kwargs.get('activation', None)
-                
-            def __call__(self, inputs):
-                # For models that actually try to use this layer, fall back to Conv2D
-                # This provides similar functionality to keep the model working
-                return tf.keras.layers.Conv2D(
-                    filters=self.filters,
-                    kernel_size=self.kernel_size,
-                    strides=self.strides,
-                    padding=self.padding,
-                    activation=self.activation
-                )(inputs)
-                
-        # Add the placeholder to tf.keras.layers
-        setattr(tf.keras.layers, 'LocallyConnected2D', LocallyConnected2DPlaceholder)
-        logger.info("LocallyConnected2D compatibility layer added successfully")
-    
-    # Now try to import DeepFace with our compatibility layer in place
-    from deepface import DeepFace
-    DEEPFACE_AVAILABLE = True
-    logger.info("DeepFace successfully imported with compatibility layer")
-    
-except Exception as e:
-    DEEPFACE_AVAILABLE = False
-    logger.error(f"DeepFace import failed: {str(e)}")
-    logger.info("Using mock data for emotion analysis")
-# ===== End of Compatibility Layer =====
+# Model loading lives in inference.py, which sets up the TensorFlow/Keras
+# compatibility layer before importing DeepFace
+import inference
+from inference import compute_embedding
+from face_index import create_index, spherical_kmeans
+from identity_store import IdentityStore
+import metrics
+from face_tracking import SessionRegistry, TrackingSession, expand_box
+from frame_cache import FrameCache, dhash
+from admission import AdmissionController, ServerOverloaded
 
 # Initialize FastAPI application with detailed metadata
 app = FastAPI(
@@ -88,12 +64,13 @@ app = FastAPI(
 )
 
 # Configure CORS with strict settings for security
+ALLOWED_ORIGINS = [
+    "http://localhost:3000",
+    "https://chenthemanl.github.io"
+]
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",
-        "https://chenthemanl.github.io"
-    ],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
@@ -111,13 +88,23 @@ class EncryptionService:
         # Get the encryption key from environment or generate one if not present
         self.encryption_key = self._get_or_create_key()
         self.fernet = Fernet(self.encryption_key)
+        self.name_index_key = self._get_name_index_key()
         
-        # Create a directory to store the mapping between encrypted and original names
+        # Identities live in SQLite; the JSON mapping file is only read to migrate it
         self.mapping_file = os.path.join(DATA_DIR, "encryption_mapping.json")
-        os.makedirs(os.path.dirname(self.mapping_file), exist_ok=True)
-        
-        # Load existing mappings or create new mapping file
+        self.store = IdentityStore(os.path.join(DATA_DIR, "identities.db"))
+
+        # Load existing mappings into memory for lookups
         self.name_mapping = self._load_mapping()
+        self._backfill_name_index()
+
+        # Recently decrypted names, so recognised people are not decrypted on every frame
+        self._name_cache = OrderedDict()
+        self._name_cache_lock = threading.Lock()
+        self._name_cache_timer = None
+        self.name_cache_hits = 0
+        self.name_cache_misses = 0
+        self._schedule_name_cache_wipe()
         
         logger.info("Encryption service initialized")
 
@@ -159,24 +146,115 @@ class EncryptionService:
         
         return key
 
+    def _get_name_index_key(self):
+        """
+        Secret for the name lookup index
+
+        HAPPY_NAME_INDEX_KEY if set, otherwise derived from the encryption key
+        so the index never needs a second secret to be provisioned.
+        """
+        env_key = os.getenv("HAPPY_NAME_INDEX_KEY")
+        if env_key:
+            return env_key.encode()
+        return hmac.new(self.encryption_key, b"happy-name-index", hashlib.sha256).digest()
+
+    @staticmethod
+    def normalize_name(name):
+        """Canonical form of a name for lookups: NFKC, case-folded, single spaces"""
+        return " ".join(unicodedata.normalize("NFKC", name).casefold().split())
+
+    def name_hmac(self, name):
+        """Keyed hash of a normalized name; lets names be looked up without storing them in plaintext"""
+        return hmac.new(self.name_index_key, self.normalize_name(name).encode(), hashlib.sha256).hexdigest()
+
+    def _backfill_name_index(self):
+        """Index names of identities enrolled before the name index existed"""
+        try:
+            missing = self.store.missing_name_hmacs()
+            if not missing:
+                return
+            records = []
+            for encrypted_id, encrypted_name in missing:
+                try:
+                    name = self.fernet.decrypt(encrypted_name.encode()).decode()
+                except Exception as e:
+                    logger.error(f"Error decrypting name for {encrypted_id}: {e}")
+                    continue
+                records.append((encrypted_id, self.name_hmac(name)))
+            self.store.set_name_hmacs(records)
+            logger.info(f"Indexed names of {len(records)} identities")
+        except Exception as e:
+            logger.error(f"Error building name index: {e}")
+
+    def find_ids_by_name(self, name):
+        """
+        Find the identities enrolled under a name
+
+        Args:
+            name (str): The person's name
+
+        Returns:
+            list: Encrypted identifiers, oldest enrollment first
+        """
+        return self.store.find_by_name_hmac(self.name_hmac(name))
+
     def _load_mapping(self):
         """Load the mapping of encrypted names to real names"""
         try:
-            if os.path.exists(self.mapping_file):
-                with open(self.mapping_file, 'r') as f:
-                    return json.load(f)
-            return {}
+            self.store.migrate_from_json(self.mapping_file)
         except Exception as e:
-            logger.error(f"Error loading encryption mapping: {e}")
-            return {}
+            logger.error(f"Error migrating encryption mapping: {e}")
 
-    def _save_mapping(self):
-        """Save the mapping of encrypted names to real names"""
         try:
-            with open(self.mapping_file, 'w') as f:
-                json.dump(self.name_mapping, f)
+            return self.store.load_mapping()
         except Exception as e:
-            logger.error(f"Error saving encryption mapping: {e}")
+            logger.error(f"Error loading encryption mapping: {e}")
+            return {}
+
+    def delete_name(self, encrypted_id):
+        """
+        Remove a person's name mapping
+
+        Args:
+            encrypted_id (str): The encrypted identifier
+
+        Returns:
+            bool: Whether a mapping was removed
+        """
+        # Store first, so a concurrent decrypt cannot cache the name again afterwards
+        deleted = self.store.delete(encrypted_id)
+        self.name_mapping.pop(encrypted_id, None)
+        with self._name_cache_lock:
+            self._name_cache.pop(encrypted_id, None)
+        return deleted
+
+    def _schedule_name_cache_wipe(self):
+        """Wipe decrypted names every NAME_CACHE_WIPE_SECONDS so plaintext does not linger in memory"""
+        if NAME_CACHE_WIPE_SECONDS <= 0:
+            return
+        self._name_cache_timer = threading.Timer(NAME_CACHE_WIPE_SECONDS, self._wipe_name_cache)
+        self._name_cache_timer.daemon = True
+        self._name_cache_timer.start()
+
+    def _wipe_name_cache(self):
+        self.clear_name_cache()
+        self._schedule_name_cache_wipe()
+
+    def clear_name_cache(self):
+        """Forget every decrypted name"""
+        with self._name_cache_lock:
+            self._name_cache.clear()
+
+    def name_cache_stats(self):
+        """Size and hit/miss counters of the decrypted-name cache"""
+        with self._name_cache_lock:
+            return {
+                "entries": len(self._name_cache),
+                "max_entries": NAME_CACHE_SIZE,
+                "wipe_seconds": NAME_CACHE_WIPE_SECONDS or None,
+                "hits": self.name_cache_hits,
+                "misses": self.name_cache_misses
+            }
 
     def encrypt_name(self, name):
         """
@@ -188,38 +266,75 @@ class EncryptionService:
         Returns:
             str: The encrypted identifier to use for storage
         """
-        # Generate a random ID instead of encrypting the name directly
-        # This provides better security as the encrypted name isn't stored directly in file paths
-        encrypted_id = str(uuid.uuid4())
-        
-        # Store the mapping between the encrypted ID and the encrypted name
-        encrypted_name = self.fernet.encrypt(name.encode()).decode()
-        self.name_mapping[encrypted_id] = encrypted_name
-        self._save_mapping()
-        
+        encrypted_id = self.encrypt_names([name])[0]
         logger.info(f"Name encrypted and mapped to ID: {encrypted_id}")
         return encrypted_id
 
-    def decrypt_name(self, encrypted_id):
+    def encrypt_names(self, names):
+        """
+        Encrypt several names and store all their mappings in one transaction
+
+        Args:
+            names (list): The people's names to encrypt
+
+        Returns:
+            list: The encrypted identifiers, in the same order
+        """
+        records = []
+        for name in names:
+            # Generate a random ID instead of encrypting the name directly
+            # This provides better security as the encrypted name isn't stored directly in file paths
+            encrypted_id = str(uuid.uuid4())
+            encrypted_name = self.fernet.encrypt(name.encode()).decode()
+            records.append((encrypted_id, encrypted_name, self.name_hmac(name)))
+
+        # Store the mapping between the encrypted ID and the encrypted name
+        self.store.add_many(records)
+        for encrypted_id, encrypted_name, _ in records:
+            self.name_mapping[encrypted_id] = encrypted_name
+        return [encrypted_id for encrypted_id, _, _ in records]
+
+    def decrypt_name(self, encrypted_id, cache=True):
         """
         Decrypt a person's name from the mapping
         
         Args:
             encrypted_id (str): The encrypted identifier
+            cache (bool): Keep the result in the decrypted-name cache; bulk
+                readers pass False so they do not evict the people seen at kiosks
             
         Returns:
             str: The original name, or "Unknown" if not found
         """
+        with self._name_cache_lock:
+            name = self._name_cache.get(encrypted_id)
+            if name is not None:
+                self._name_cache.move_to_end(encrypted_id)
+                self.name_cache_hits += 1
+                return name
+            self.name_cache_misses += 1
+
         if encrypted_id not in self.name_mapping:
-            return "Unknown"
-            
+            # Another server process may have enrolled this person since we loaded
+            stored = self.store.get(encrypted_id)
+            if stored is None:
+                return "Unknown"
+            self.name_mapping[encrypted_id] = stored
+
         encrypted_name = self.name_mapping[encrypted_id]
         try:
-            return self.fernet.decrypt(encrypted_name.encode()).decode()
+            name = self.fernet.decrypt(encrypted_name.encode()).decode()
         except Exception as e:
             logger.error(f"Error decrypting name: {e}")
             return "Unknown"
 
+        if cache and NAME_CACHE_SIZE > 0:
+            with self._name_cache_lock:
+                self._name_cache[encrypted_id] = name
+                while len(self._name_cache) > NAME_CACHE_SIZE:
+                    self._name_cache.popitem(last=False)
+        return name
+
     def encrypt_image(self, image_data):
         """
         Encrypt image data
@@ -254,18 +369,124 @@ KNOWN_FACES_DIR = os.path.join(DATA_DIR, "known_faces")
 ENCRYPTED_FACES_DIR = os.path.join(DATA_DIR, "encrypted_faces")
 ALLOWED_IMAGE_TYPES = {"image/jpeg", "image/png", "image/jpg"}
 MAX_IMAGE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "5000"))  # Images accepted by one batch enrollment
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", str(512 * 1024 * 1024)))  # Total uncompressed image bytes per batch
+ENROLL_CONCURRENCY = int(os.getenv("ENROLL_CONCURRENCY", "32"))  # Batch images decoded, detected and embedded at once
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
 MIN_FACE_SIZE = (100, 100)  # Minimum face size for reliable detection
 EMOTION_CONFIDENCE_THRESHOLD = 0.65  # Increased threshold for higher precision
 SECONDARY_EMOTION_THRESHOLD = 0.25  # Threshold for secondary emotions
 FACE_DETECTION_MODELS = ['opencv', 'retinaface', 'mtcnn']  # Multiple detection models
+RECOGNITION_DISTANCE_THRESHOLD = 0.40  # DeepFace's cosine distance threshold for VGG-Face
+REFERENCE_IMAGE_NAME = "reference.jpg"
+EMBEDDING_FILE_NAME = "embedding.npy"  # Single reference embedding written by older versions
+EMBEDDINGS_FILE_NAME = "embeddings.npy"  # (K, D) embeddings of every reference image of a person
+IDENTITY_PROTOTYPES = int(os.getenv("IDENTITY_PROTOTYPES", "3"))  # Index entries per person, whatever K is
+FACE_INDEX_BACKEND = os.getenv("FACE_INDEX_BACKEND", "exact")  # exact, ivf or hnsw
+INFERENCE_POOL_SIZE = int(os.getenv("INFERENCE_POOL_SIZE", "2"))  # Threads running inference in thread mode
+INFERENCE_WORKER_PROCESSES = int(os.getenv("INFERENCE_WORKER_PROCESSES", "0"))  # >0 runs inference in worker processes
+INFERENCE_QUEUE_DEPTH = int(os.getenv("INFERENCE_QUEUE_DEPTH", "16"))  # Max jobs submitted to the pool at once
+IO_POOL_SIZE = int(os.getenv("IO_POOL_SIZE", "4"))  # Threads for image decoding and file I/O
+GALLERY_VERSION_FILE = os.path.join(DATA_DIR, "gallery.version")  # Touched whenever the gallery changes
+NAME_CACHE_SIZE = int(os.getenv("NAME_CACHE_SIZE", "1024"))  # Decrypted names kept in memory; 0 disables
+NAME_CACHE_WIPE_SECONDS = float(os.getenv("NAME_CACHE_WIPE_SECONDS", "0"))  # Periodically forget decrypted names; 0 never
+DETECTOR_COST_ORDER = ['opencv', 'mtcnn', 'retinaface']  # Cheapest first, used until latencies are measured
+DETECTOR_TARGET_SUCCESS_RATE = float(os.getenv("DETECTOR_TARGET_SUCCESS_RATE", "0.9"))  # Rate a detector must reach to lead
+DETECTOR_STATS_WINDOW = int(os.getenv("DETECTOR_STATS_WINDOW", "200"))  # Recent attempts kept per detector
+DETECTOR_MIN_SAMPLES = int(os.getenv("DETECTOR_MIN_SAMPLES", "20"))  # Attempts needed before a success rate counts
+DETECTOR_EXPLORE_RATE = float(os.getenv("DETECTOR_EXPLORE_RATE", "0.05"))  # Share of requests that re-test a demoted detector
+DETECTOR_ERROR_PENALTY = float(os.getenv("DETECTOR_ERROR_PENALTY", "2.0"))  # Seconds recorded for a detector that raised
+EMOTION_ANALYSIS_DEADLINE = float(os.getenv("EMOTION_ANALYSIS_DEADLINE", "3.0"))  # Seconds to wait for slower detectors
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "16"))  # Faces per emotion/embedding model call
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))  # Longest a face waits for its batch to fill
+ANALYSIS_MAX_IN_FLIGHT = int(os.getenv("ANALYSIS_MAX_IN_FLIGHT", "8"))  # Analyses running at once
+ANALYSIS_MAX_QUEUED = int(os.getenv("ANALYSIS_MAX_QUEUED", "16"))  # Analyses waiting for a slot before new ones get 503
+ANALYSIS_MAX_PER_CLIENT = int(os.getenv("ANALYSIS_MAX_PER_CLIENT", "2"))  # Running plus waiting analyses per session_id before 429
+ANALYSIS_MAX_QUEUE_WAIT = float(os.getenv("ANALYSIS_MAX_QUEUE_WAIT", "5"))  # Seconds an analysis may wait for a slot
+DISCONNECT_POLL_SECONDS = 0.1  # How often a running analysis checks that its client is still connected
+QUALITY_TIERS = ['fast', 'standard', 'full']  # Analysis quality tiers, cheapest first
+ANALYSIS_DEFAULT_TIER = os.getenv("ANALYSIS_DEFAULT_TIER", "standard")  # Tier for requests that ask for "auto"
+QUALITY_QUEUE_TARGET_MS = float(os.getenv("QUALITY_QUEUE_TARGET_MS", "250"))  # Queue latency above which tiers step down
+QUALITY_TIER_COOLDOWN = float(os.getenv("QUALITY_TIER_COOLDOWN", "5"))  # Seconds between tier changes
+FAST_TIER_DETECTOR = 'opencv'  # Only detector the fast tier uses
+CLIENT_CLOSED_REQUEST = 499  # Status recorded for requests whose client went away
+TRACK_IOU_THRESHOLD = float(os.getenv("TRACK_IOU_THRESHOLD", "0.5"))  # Box overlap needed to keep a track
+TRACK_CONFIDENCE_DECAY = float(os.getenv("TRACK_CONFIDENCE_DECAY", "0.9"))  # Track confidence kept per second since identification
+TRACK_MIN_CONFIDENCE = float(os.getenv("TRACK_MIN_CONFIDENCE", "0.5"))  # Re-identify once confidence falls below this
+TRACK_SEARCH_MARGIN = 0.5  # Detection first searches the tracked box grown by this fraction on each side
+DETECTION_USE_TRACKED_ROI = os.getenv("DETECTION_USE_TRACKED_ROI", "true").lower() == "true"  # Search the tracked box first
+MAX_DETECTION_DIMENSION = int(os.getenv("MAX_DETECTION_DIMENSION", "640"))  # Longest side detectors run at; 0 for full resolution
+MAX_TRACKING_SESSIONS = int(os.getenv("MAX_TRACKING_SESSIONS", "256"))
+MOCK_INFERENCE = os.getenv("HAPPY_MOCK_INFERENCE", "false").lower() == "true"  # Answer analyses with fixed mock data, for benchmarks
+TRACKING_SESSION_TIMEOUT = float(os.getenv("TRACKING_SESSION_TIMEOUT", "300"))  # Seconds before an idle session is dropped
+FRAME_CACHE_SIZE = int(os.getenv("FRAME_CACHE_SIZE", "64"))  # Cached analysis results; 0 disables the cache
+FRAME_CACHE_TTL = float(os.getenv("FRAME_CACHE_TTL", "10"))  # Seconds a cached result stays valid
+FRAME_CACHE_MAX_DISTANCE = int(os.getenv("FRAME_CACHE_MAX_DISTANCE", "4"))  # Differing hash bits (of 64) still counted as the same frame
 
 # Initialize our encryption service
 encryption_service = EncryptionService()
 
+def create_inference_executor():
+    """
+    Build the pool that runs model inference
+
+    With INFERENCE_WORKER_PROCESSES set, each worker process loads the models
+    once in its initializer and tasks reach it over the executor's local queue.
+    Workers only compute emotions and embeddings; the face gallery stays in the
+    serving process, so adds and deletes never need to be pushed to workers.
+    """
+    if INFERENCE_WORKER_PROCESSES > 0:
+        return ProcessPoolExecutor(
+            max_workers=INFERENCE_WORKER_PROCESSES,
+            # TensorFlow does not survive fork, so workers start fresh
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=inference.init_worker,
+            initargs=(FACE_DETECTION_MODELS,)
+        )
+    return ThreadPoolExecutor(max_workers=INFERENCE_POOL_SIZE, thread_name_prefix="inference")
+
+# Bounded pools so the event loop only does networking
+inference_executor = create_inference_executor()
+# asyncio primitives are created on first use: on Python 3.9 they bind to the loop
+# current at construction, and servers import this module before starting theirs
+_inference_slots: Optional[asyncio.Semaphore] = None
+io_executor = ThreadPoolExecutor(max_workers=IO_POOL_SIZE, thread_name_prefix="io")
+
+# Set once the models are warm and the gallery is loaded; /health reports 503 until then
+startup_state: Dict[str, Any] = {"ready": False, "error": None, "workers": []}
+
 class FaceRecognitionError(Exception):
     """Custom exception for face recognition specific errors"""
     pass
 
+# Prometheus metrics served by /metrics
+http_request_seconds = metrics.registry.histogram(
+    "happy_http_request_seconds", "HTTP request latency by route", ["method", "route"])
+http_requests = metrics.registry.counter(
+    "happy_http_requests", "HTTP requests by route and status code", ["method", "route", "status"])
+stage_seconds = metrics.registry.histogram(
+    "happy_stage_seconds", "Time spent in each stage of the analysis pipeline", ["stage"])
+detector_seconds = metrics.registry.histogram(
+    "happy_detector_seconds", "Face detector latency by backend and outcome", ["detector", "outcome"])
+inference_batch_size = metrics.registry.histogram(
+    "happy_inference_batch_size", "Faces per emotion/embedding model call", buckets=(1, 2, 4, 8, 16, 32, 64))
+detector_fallbacks = metrics.registry.counter(
+    "happy_detector_fallbacks", "Escalations from a face detector that found no face to the next one", ["from_detector"])
+mock_responses = metrics.registry.counter(
+    "happy_mock_responses", "Analysis responses served from mock data because DeepFace is unavailable")
+frame_cache_lookups = metrics.registry.counter(
+    "happy_frame_cache_lookups", "Near-duplicate frame cache lookups", ["result"])
+identifications = metrics.registry.counter(
+    "happy_identifications", "Analysed faces by whether they were identified or kept their tracked identity", ["mode"])
+errors = metrics.registry.counter(
+    "happy_errors", "Errors by pipeline stage", ["stage"])
+admission_rejections = metrics.registry.counter(
+    "happy_admission_rejections", "Analyses refused by admission control", ["reason"])
+client_disconnects = metrics.registry.counter(
+    "happy_client_disconnects", "Analyses cancelled because the client disconnected")
+analysis_tiers = metrics.registry.counter(
+    "happy_analysis_tiers", "Analyses by the quality tier that served them", ["tier"])
+
 def get_mock_emotion_data(random_variance=True):
     """
     Generate mock emotion data when face recognition is unavailable
@@ -276,8 +497,6 @@ def get_mock_emotion_data(random_variance=True):
     Returns:
         dict: Mock emotion analysis data
     """
-    import random
-    
     # Base emotion scores
     emotions = {
         "angry": 0.05,
@@ -339,16 +558,745 @@ def ensure_directories() -> str:
         logger.error(f"Failed to create directories: {str(e)}")
         raise FaceRecognitionError("Failed to initialize storage directories")
 
-def cleanup_temp_file(file_path: str) -> None:
-    """Safely remove temporary files"""
+class FaceGallery:
+    """
+    In-memory store of reference embeddings for every known face.
+
+    Embeddings are computed once at enrollment (and backfilled at startup for
+    older enrollments) and persisted next to the reference images. They are held
+    in a FaceIndex so that recognising a probe face is one embedding plus one
+    index query instead of a DeepFace.verify call per person. The index backend
+    (exact, ivf or hnsw) is chosen with FACE_INDEX_BACKEND.
+
+    A person may have several reference images. Their embeddings are reduced
+    to at most IDENTITY_PROTOTYPES prototypes (the embeddings themselves when
+    there are few, otherwise spherical k-means centroids), so matching costs
+    the same however many photos were enrolled. Index keys are
+    "<encrypted_id>#<n>" and matches are reported per identity.
+    """
+
+    def __init__(self, backend: str = "exact", version_file: Optional[str] = None):
+        self.backend = backend
+        self.index = create_index(backend)
+        self._prototype_counts: Dict[str, int] = {}
+
+        # Every process serving requests keeps its own index; a shared version
+        # file tells them when another process has added or deleted a face
+        self.version_file = version_file
+        self._version = None
+        self._reload_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._prototype_counts)
+
+    @property
+    def version(self) -> Optional[int]:
+        """Version of the shared gallery this process last loaded or published"""
+        return self._version
+
+    def _read_version(self) -> Optional[int]:
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except (TypeError, FileNotFoundError):
+            return None
+
+    @staticmethod
+    def prototypes(embeddings: np.ndarray) -> np.ndarray:
+        """Reduce a person's (K, D) reference embeddings to at most IDENTITY_PROTOTYPES unit vectors"""
+        embeddings = np.atleast_2d(embeddings).astype(np.float32)
+        embeddings = embeddings / np.maximum(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12)
+        if len(embeddings) <= IDENTITY_PROTOTYPES:
+            return embeddings
+        if IDENTITY_PROTOTYPES == 1:
+            centroid = embeddings.sum(axis=0)
+            return (centroid / max(np.linalg.norm(centroid), 1e-12))[np.newaxis]
+        return spherical_kmeans(embeddings, IDENTITY_PROTOTYPES)
+
+    @staticmethod
+    def read_embeddings(person_dir: Path) -> Optional[np.ndarray]:
+        """A person's stored (K, D) reference embeddings, or None if none are stored"""
+        if (person_dir / EMBEDDINGS_FILE_NAME).exists():
+            return np.atleast_2d(np.load(person_dir / EMBEDDINGS_FILE_NAME))
+        if (person_dir / EMBEDDING_FILE_NAME).exists():
+            return np.load(person_dir / EMBEDDING_FILE_NAME)[np.newaxis]
+        return None
+
+    def _add_to(self, index, counts: Dict[str, int], encrypted_id: str, embeddings: np.ndarray) -> None:
+        for n in range(counts.pop(encrypted_id, 0)):
+            index.remove(f"{encrypted_id}#{n}")
+        prototypes = self.prototypes(embeddings)
+        for n, prototype in enumerate(prototypes):
+            index.add(f"{encrypted_id}#{n}", prototype)
+        counts[encrypted_id] = len(prototypes)
+
+    def load(self, known_faces_dir: str) -> List[Path]:
+        """
+        Build a fresh index from stored embeddings
+
+        Returns:
+            list: Person directories that have a reference image but no embedding yet
+        """
+        version = self._read_version()
+        index = create_index(self.backend)
+        counts = {}
+        missing = []
+
+        for person_dir in Path(known_faces_dir).iterdir():
+            if not person_dir.is_dir():
+                continue
+
+            try:
+                embeddings = self.read_embeddings(person_dir)
+                if embeddings is not None:
+                    self._add_to(index, counts, person_dir.name, embeddings)
+                elif (person_dir / REFERENCE_IMAGE_NAME).exists():
+                    missing.append(person_dir)
+            except Exception as e:
+                logger.warning(f"Error loading embedding for {person_dir}: {str(e)}")
+
+        self.index = index
+        self._prototype_counts = counts
+        self._version = version
+        logger.info(f"Face gallery loaded with {len(counts)} people, {len(index)} prototypes ({self.backend} index)")
+        return missing
+
+    def refresh_if_stale(self, known_faces_dir: str) -> bool:
+        """Reload the index if another process has changed the gallery since our last load"""
+        if self._read_version() == self._version:
+            return False
+        # Only one reload at a time; other requests keep matching against the current index
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self.load(known_faces_dir)
+            return True
+        finally:
+            self._reload_lock.release()
+
+    def publish(self) -> Tuple[Optional[int], Optional[int]]:
+        """
+        Tell other processes that this process has changed the gallery
+
+        Returns:
+            tuple: (version before, version after), for other in-memory views of the gallery
+        """
+        if not self.version_file:
+            return None, None
+        previous = self._read_version()
+        Path(self.version_file).touch()
+        current = self._read_version()
+        # If someone else changed the gallery since our last load, leave our version stale to pick it up
+        if previous == self._version:
+            self._version = current
+        return previous, current
+
+    def add(self, encrypted_id: str, embeddings: np.ndarray) -> None:
+        """Add or replace a known face from all of its reference embeddings, (D,) or (K, D)"""
+        self._add_to(self.index, self._prototype_counts, encrypted_id, embeddings)
+
+    def remove(self, encrypted_id: str) -> None:
+        """Remove every prototype of a known face if it is present"""
+        for n in range(self._prototype_counts.pop(encrypted_id, 0)):
+            self.index.remove(f"{encrypted_id}#{n}")
+
+    def match(self, embedding: np.ndarray) -> Tuple[Optional[str], Optional[float]]:
+        """
+        Find the closest known face to a probe embedding
+
+        Args:
+            embedding (np.ndarray): A unit-length probe embedding
+
+        Returns:
+            tuple: (encrypted_id, cosine_distance), or (None, distance) when the
+            closest face is above the recognition threshold
+        """
+        neighbours = self.index.search(embedding, k=1)
+        if not neighbours:
+            return None, None
+
+        key, distance = neighbours[0]
+        encrypted_id = key.split("#", 1)[0]
+        if distance <= RECOGNITION_DISTANCE_THRESHOLD:
+            return encrypted_id, distance
+        return None, distance
+
+# In-memory embedding gallery used for recognition
+face_gallery = FaceGallery(FACE_INDEX_BACKEND, GALLERY_VERSION_FILE)
+
+class FaceCatalog:
+    """
+    In-memory listing of known faces for /known-faces.
+
+    Built with one directory scan and one decrypt per face, then kept up to
+    date as faces are added and deleted, so listing costs no file system or
+    decryption work. Changes made by other server processes are picked up
+    through the gallery version file. Every change bumps the generation that,
+    together with the query, makes up a listing's ETag.
+    """
+
+    def __init__(self, version_file: Optional[str] = None):
+        self.version_file = version_file
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._ordered: Optional[List[Dict[str, Any]]] = None
+        self._keys: List[Tuple[float, str]] = []
+        self._loaded = False
+        self._version = None
+        self._boot_id = uuid.uuid4().hex[:8]
+        self.generation = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _read_version(self) -> Optional[int]:
+        try:
+            return os.stat(self.version_file).st_mtime_ns
+        except (TypeError, FileNotFoundError):
+            return None
+
+    @staticmethod
+    def _entry(encrypted_id: str, name: str, reference_file: Path) -> Dict[str, Any]:
+        stat = reference_file.stat()
+        return {
+            "id": encrypted_id,
+            "name": name,
+            "added_date": datetime.fromtimestamp(stat.st_ctime).isoformat(),
+            "last_modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            "file_size": stat.st_size,
+            "_added": stat.st_ctime
+        }
+
+    def _changed(self) -> None:
+        self._ordered = None
+        self.generation += 1
+
+    def load(self, known_faces_dir: str) -> None:
+        """Rebuild the catalog from the known faces directory"""
+        version = self._read_version()
+        entries = {}
+        known_faces_path = Path(known_faces_dir)
+        if known_faces_path.exists():
+            # Scan directories rather than files since we're now using directories for each person
+            for person_dir in [d for d in known_faces_path.iterdir() if d.is_dir()]:
+                try:
+                    # The directory name is the encrypted ID
+                    reference_file = person_dir / REFERENCE_IMAGE_NAME
+                    if reference_file.exists():
+                        name = encryption_service.decrypt_name(person_dir.name, cache=False)
+                        entries[person_dir.name] = self._entry(person_dir.name, name, reference_file)
+                except Exception as e:
+                    logger.warning(f"Error getting metadata for {person_dir}: {str(e)}")
+
+        with self._lock:
+            self._entries = entries
+            self._version = version
+            self._loaded = True
+            self._changed()
+        logger.info(f"Face catalog loaded with {len(entries)} faces")
+
+    def refresh_if_stale(self, known_faces_dir: str) -> None:
+        """Load on first use, and reload if another process has changed the gallery"""
+        if not self._loaded or self._read_version() != self._version:
+            self.load(known_faces_dir)
+
+    def follow_publish(self, previous: Optional[int], current: Optional[int]) -> None:
+        """Adopt the version from face_gallery.publish() if nothing else changed in between"""
+        with self._lock:
+            if previous == self._version:
+                self._version = current
+
+    def add(self, encrypted_id: str, name: str, reference_path: str) -> None:
+        entry = self._entry(encrypted_id, name, Path(reference_path))
+        with self._lock:
+            self._entries[encrypted_id] = entry
+            self._changed()
+
+    def remove(self, encrypted_id: str) -> None:
+        with self._lock:
+            if self._entries.pop(encrypted_id, None) is not None:
+                self._changed()
+
+    def etag(self, limit: Optional[int] = None, cursor: Optional[str] = None, count_only: bool = False) -> str:
+        """ETag of one listing: the catalog generation plus the query that selected the response"""
+        # A count does not depend on the page, and no cursor means the first page
+        query = "count" if count_only else f"{limit or 'all'}:{cursor or ''}"
+        digest = hashlib.sha256(query.encode()).hexdigest()[:12]
+        return f'W/"{self._boot_id}-{self.generation}-{digest}"'
+
+    def page(self, limit: Optional[int] = None, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Faces newest first, starting after cursor
+
+        Returns:
+            tuple: (faces, cursor for the next page or None)
+        """
+        with self._lock:
+            if self._ordered is None:
+                self._ordered = sorted(self._entries.values(), key=lambda e: (-e["_added"], e["id"]))
+                self._keys = [(-e["_added"], e["id"]) for e in self._ordered]
+            ordered, keys = self._ordered, self._keys
+
+        start = 0
+        if cursor:
+            try:
+                added, encrypted_id = base64.urlsafe_b64decode(cursor.encode()).decode().split(":", 1)
+                start = bisect.bisect_right(keys, (-float(added), encrypted_id))
+            except Exception:
+                raise ValueError("Invalid cursor")
+
+        end = len(ordered) if limit is None else start + limit
+        faces = [{k: v for k, v in e.items() if k != "_added"} for e in ordered[start:end]]
+        next_cursor = None
+        if end < len(ordered):
+            last = ordered[end - 1]
+            next_cursor = base64.urlsafe_b64encode(f"{last['_added']!r}:{last['id']}".encode()).decode()
+        return faces, next_cursor
+
+# Listing behind /known-faces, maintained on add and delete
+face_catalog = FaceCatalog(GALLERY_VERSION_FILE)
+
+async def run_inference(func, *args, **kwargs):
+    """
+    Run a model call on the inference pool
+
+    At most INFERENCE_QUEUE_DEPTH calls are handed to the pool at once; further
+    callers wait here instead of piling up inside the executor's queue. In
+    process mode func and its arguments must be picklable, so pass functions
+    from the inference module.
+    """
+    global _inference_slots
+    if _inference_slots is None:
+        _inference_slots = asyncio.Semaphore(INFERENCE_QUEUE_DEPTH)
+    wait_start = time.perf_counter()
+    async with _inference_slots:
+        quality_governor.observe(time.perf_counter() - wait_start)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(inference_executor, functools.partial(func, *args, **kwargs))
+
+async def run_blocking(func, *args, **kwargs):
+    """Run blocking image decoding or file I/O on the I/O thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, functools.partial(func, *args, **kwargs))
+
+class MicroBatcher:
+    """
+    Collects face crops from concurrent requests and runs the emotion and
+    embedding models on them as one batch.
+
+    A batch is dispatched as soon as max_batch_size faces are waiting or
+    max_wait_ms after its first face arrived, whichever comes first, so a
+    lone request waits at most max_wait_ms. Raising max_wait_ms trades
+    latency for larger batches under load.
+    """
+
+    def __init__(self, max_batch_size: int, max_wait_ms: float):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._pending: List[Tuple[Tuple[np.ndarray, bool], asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batches = 0
+        self.faces = 0
+
+    async def submit(self, face: np.ndarray, needs_embedding: bool) -> Dict[str, Any]:
+        """Queue one face and wait for its own prediction"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(((face, needs_embedding), future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            # Keep a reference so the task is not garbage collected mid-flight
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[Tuple[np.ndarray, bool], asyncio.Future]]) -> None:
+        # Faces whose request was cancelled, e.g. because the client disconnected, are not analysed
+        batch = [(item, future) for item, future in batch if not future.cancelled()]
+        if not batch:
+            return
+        self.batches += 1
+        self.faces += len(batch)
+        inference_batch_size.observe(len(batch))
+        try:
+            with stage_seconds.labels("model_batch").time():
+                results = await run_inference(inference.predict_faces, [item for item, _ in batch])
+        except Exception as e:
+            errors.labels("inference").inc()
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "batches": self.batches,
+            "average_batch_size": round(self.faces / self.batches, 2) if self.batches else 0
+        }
+
+# Batches emotion and embedding inference across concurrent /analyze-face requests
+face_batcher = MicroBatcher(BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+
+# Bounds the analyses running and waiting across /analyze-face and /ws/analyze
+admission = AdmissionController(
+    ANALYSIS_MAX_IN_FLIGHT, ANALYSIS_MAX_QUEUED, ANALYSIS_MAX_PER_CLIENT, ANALYSIS_MAX_QUEUE_WAIT
+)
+
+async def finish_unless_disconnected(request: Request, task: asyncio.Future) -> bool:
+    """
+    Wait for task while the HTTP client stays connected
+
+    Returns:
+        bool: True once task finished, False if the client disconnected first
+        and task was cancelled
+    """
     try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-    except Exception as e:
-        logger.warning(f"Failed to cleanup temporary file {file_path}: {str(e)}")
+        while not task.done():
+            await asyncio.wait({task}, timeout=DISCONNECT_POLL_SECONDS)
+            if not task.done() and await request.is_disconnected():
+                task.cancel()
+                client_disconnects.inc()
+                return False
+        return True
+    finally:
+        # The handler itself was cancelled, e.g. on shutdown
+        if not task.done():
+            task.cancel()
+
+class DetectorSelector:
+    """
+    Chooses the face detector for /analyze-face from measured performance.
+
+    Each backend keeps a rolling window of (latency, success) samples. The
+    plan tries the cheapest backend whose success rate meets the target.
+    Frames without a face are the common case at an idle kiosk, so a miss
+    escalates to one more backend only while the primary has not proven its
+    success rate, or on the explore_rate share of requests; no plan runs more
+    than two backends. A miss only counts against a backend when a later
+    backend did find a face in the same frame, so empty frames do not demote
+    the cheap detectors. A backend that raised counts as a failure with a
+    penalty latency, so a broken backend never looks cheapest. A small share
+    of requests re-tests demoted backends so their statistics stay current.
+    """
+
+    def __init__(self, backends: List[str], target_success_rate: float, window: int,
+                 min_samples: int, explore_rate: float):
+        self.backends = backends
+        self.target_success_rate = target_success_rate
+        self.min_samples = min_samples
+        self.explore_rate = explore_rate
+        self._samples = {backend: deque(maxlen=window) for backend in backends}
+        # Outcomes are kept apart from latencies, so a long run of empty frames does not flush them out
+        self._outcomes = {backend: deque(maxlen=window) for backend in backends}
+        self._selected = {backend: 0 for backend in backends}
+        self._lock = threading.Lock()
+
+    def _mean_latency(self, backend: str) -> Optional[float]:
+        latencies = self._samples[backend]
+        return sum(latencies) / len(latencies) if latencies else None
+
+    def _success_rate(self, backend: str) -> Optional[float]:
+        outcomes = self._outcomes[backend]
+        if len(outcomes) < self.min_samples:
+            return None
+        return sum(outcomes) / len(outcomes)
+
+    def _eligible(self, backend: str) -> bool:
+        # Backends without enough samples yet count as eligible so they get measured
+        rate = self._success_rate(backend)
+        return rate is None or rate >= self.target_success_rate
+
+    def _by_cost(self) -> List[str]:
+        # Measured backends sort by mean latency; unmeasured ones keep their prior cost order
+        prior = {backend: i for i, backend in enumerate(self.backends)}
+        return sorted(
+            self.backends,
+            key=lambda backend: (self._mean_latency(backend) is None, self._mean_latency(backend) or 0, prior[backend])
+        )
+
+    def plan(self) -> List[str]:
+        """Backends to try for the next frame, in order"""
+        with self._lock:
+            ordered = self._by_cost()
+            eligible = [backend for backend in ordered if self._eligible(backend)]
+            demoted = [backend for backend in ordered if backend not in eligible]
+
+            exploring = random.random() < self.explore_rate
+            if demoted and exploring:
+                primary = random.choice(demoted)
+            else:
+                primary = eligible[0] if eligible else ordered[-1]
+
+            self._selected[primary] += 1
+            rate = self._success_rate(primary)
+            proven = rate is not None and rate >= self.target_success_rate
+            if proven and not exploring:
+                return [primary]
+            return [primary] + [backend for backend in eligible + demoted if backend != primary][:1]
+
+    def record(self, attempts: List[Tuple[str, float, bool]]) -> None:
+        """
+        Record the detectors tried on one frame
+
+        Args:
+            attempts (list): (backend, latency_seconds, face_detected) in the order tried;
+                face_detected is None for a backend that raised
+        """
+        found = any(detected for _, _, detected in attempts)
+        with self._lock:
+            for backend, latency, detected in attempts:
+                if detected is None:
+                    self._samples[backend].append(max(latency, DETECTOR_ERROR_PENALTY))
+                    self._outcomes[backend].append(False)
+                else:
+                    self._samples[backend].append(latency)
+                    # A miss on a frame where no detector found a face says nothing about the detector
+                    if found:
+                        self._outcomes[backend].append(detected)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            current_order = self._by_cost()
+            return {
+                "policy": {
+                    "target_success_rate": self.target_success_rate,
+                    "min_samples": self.min_samples,
+                    "explore_rate": self.explore_rate,
+                    "window": self._samples[self.backends[0]].maxlen,
+                    "cost_order": current_order,
+                    "primary": next(
+                        (backend for backend in current_order if self._eligible(backend)),
+                        current_order[-1]
+                    )
+                },
+                "backends": {
+                    backend: {
+                        "samples": len(self._samples[backend]),
+                        "mean_latency_ms": None if self._mean_latency(backend) is None
+                            else round(self._mean_latency(backend) * 1000, 1),
+                        "success_rate": self._success_rate(backend),
+                        "times_selected_first": self._selected[backend]
+                    }
+                    for backend in self.backends
+                }
+            }
+
+# Picks the detector for /analyze-face from measured latency and success rate
+detector_selector = DetectorSelector(
+    DETECTOR_COST_ORDER,
+    DETECTOR_TARGET_SUCCESS_RATE,
+    DETECTOR_STATS_WINDOW,
+    DETECTOR_MIN_SAMPLES,
+    DETECTOR_EXPLORE_RATE
+)
+
+class QualityGovernor:
+    """
+    Chooses the analysis quality tier from recent queue latency.
+
+    Time spent waiting for an analysis slot or for the inference pool feeds
+    an exponential moving average. While it is above the target the highest
+    tier served (the ceiling) drops one step, at most once per cooldown, and
+    once it falls below half the target the ceiling climbs back the same way.
+    Requests get the tier they asked for, capped at the ceiling.
+
+    The ceiling starts at the default tier, and a step down from above it
+    goes straight below it, so the first step down already relieves "auto"
+    traffic. Without new queue measurements the average halves every
+    cooldown, so the ceiling also recovers when the next requests arrive
+    after a spike, not only once inference runs again.
+    """
+
+    def __init__(self, tiers: List[str], default_tier: str, target_seconds: float, cooldown_seconds: float,
+                 smoothing: float = 0.2):
+        self.tiers = tiers
+        self.default = tiers.index(default_tier)
+        self.target = target_seconds
+        self.cooldown = cooldown_seconds
+        self.smoothing = smoothing
+        self.ceiling = self.default
+        self.queue_latency = 0.0
+        self._changed_at = 0.0
+        self._observed_at = time.monotonic()
+        self.step_downs = 0
+        self.step_ups = 0
+        self.served = {tier: 0 for tier in tiers}
+
+    def observe(self, wait_seconds: float) -> None:
+        self.queue_latency += self.smoothing * (wait_seconds - self.queue_latency)
+        self._observed_at = time.monotonic()
+        self._adjust(self._observed_at)
+
+    def _adjust(self, now: float) -> None:
+        if now - self._changed_at < self.cooldown:
+            return
+
+        if self.queue_latency > self.target and self.ceiling > 0:
+            self.ceiling = max(0, min(self.ceiling, self.default) - 1)
+            self.step_downs += 1
+            self._changed_at = now
+            logger.warning(f"Queue latency {self.queue_latency * 1000:.0f}ms, analysis quality capped at {self.tiers[self.ceiling]}")
+        elif self.queue_latency < self.target / 2 and self.ceiling < len(self.tiers) - 1:
+            self.ceiling += 1
+            self.step_ups += 1
+            self._changed_at = now
+            logger.info(f"Queue latency {self.queue_latency * 1000:.0f}ms, analysis quality capped at {self.tiers[self.ceiling]}")
+
+    def choose(self, requested: str) -> str:
+        """The tier to serve a request that asked for requested (a tier name or "auto")"""
+        now = time.monotonic()
+        idle = now - self._observed_at
+        if idle > self.cooldown:
+            self.queue_latency *= 0.5 ** (idle / self.cooldown)
+            self._observed_at = now
+            self._adjust(now)
+
+        if requested == "auto":
+            requested = self.tiers[self.default]
+        tier = self.tiers[min(self.tiers.index(requested), self.ceiling)]
+        self.served[tier] += 1
+        analysis_tiers.labels(tier).inc()
+        return tier
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "tiers": self.tiers,
+            "default_tier": self.tiers[self.default],
+            "ceiling": self.tiers[self.ceiling],
+            "queue_latency_ms": round(self.queue_latency * 1000, 1),
+            "target_ms": self.target * 1000,
+            "step_downs": self.step_downs,
+            "step_ups": self.step_ups,
+            "served": dict(self.served),
+        }
+
+# Steps analysis quality down while requests queue and back up once they drain
+if ANALYSIS_DEFAULT_TIER not in QUALITY_TIERS:
+    raise FaceRecognitionError(
+        f"ANALYSIS_DEFAULT_TIER is '{ANALYSIS_DEFAULT_TIER}', it must be one of {QUALITY_TIERS}"
+    )
+quality_governor = QualityGovernor(QUALITY_TIERS, ANALYSIS_DEFAULT_TIER, QUALITY_QUEUE_TARGET_MS / 1000, QUALITY_TIER_COOLDOWN)
+
+def valid_quality(quality: str) -> bool:
+    return quality == "auto" or quality in QUALITY_TIERS
+
+# Per-camera tracks that let consecutive frames skip re-identification
+session_registry = SessionRegistry(
+    MAX_TRACKING_SESSIONS,
+    TRACKING_SESSION_TIMEOUT,
+    TRACK_IOU_THRESHOLD,
+    TRACK_CONFIDENCE_DECAY,
+    TRACK_MIN_CONFIDENCE
+)
+
+# Returns the previous result for near-identical frames from static cameras
+frame_cache = FrameCache(FRAME_CACHE_SIZE, FRAME_CACHE_TTL, FRAME_CACHE_MAX_DISTANCE)
+
+async def detect_adaptively(img: np.ndarray, escalate: bool = True) -> Dict[str, Any]:
+    """
+    Detect the face with the detector plan from detector_selector, escalating
+    to the next backend only when the current one finds no face or fails
+
+    Args:
+        escalate (bool): False runs only the plan's primary backend
+    """
+    attempts = []
+    detection = None
+
+    plan = detector_selector.plan()
+    for backend in plan if escalate else plan[:1]:
+        start_time = time.time()
+        try:
+            result = await run_inference(inference.extract_face, img, backend, MAX_DETECTION_DIMENSION)
+        except Exception as e:
+            logger.warning(f"{backend} detection failed: {str(e)}")
+            attempts.append((backend, time.time() - start_time, None))
+            detector_seconds.labels(backend, "error").observe(attempts[-1][1])
+            detector_fallbacks.labels(backend).inc()
+            continue
+
+        attempts.append((backend, time.time() - start_time, result["detected"]))
+        detector_seconds.labels(backend, "detected" if result["detected"] else "no_face").observe(attempts[-1][1])
+        # Keep the first result so an empty frame is still analysed as a whole
+        detection = detection or result
+        if result["detected"]:
+            detection = result
+            break
+        detector_fallbacks.labels(backend).inc()
+
+    detector_selector.record(attempts)
+    if detection is None:
+        raise FaceRecognitionError("Face detection failed with every detector")
+
+    detection["detectors_tried"] = [backend for backend, _, _ in attempts]
+    return detection
+
+async def detect_tracked(img: np.ndarray, session: Optional[TrackingSession]) -> Tuple[Dict[str, Any], bool]:
+    """
+    Detect the face, searching around the session's tracked box before the whole frame
+
+    Returns:
+        tuple: (detection with region in full-frame coordinates, whether the tracked region was used)
+    """
+    if DETECTION_USE_TRACKED_ROI and session is not None and session.track is not None:
+        height, width = img.shape[:2]
+        x, y, w, h = expand_box(session.track.box, TRACK_SEARCH_MARGIN, width, height)
+        # The whole frame is searched next anyway, so the region gets the primary detector only
+        try:
+            detection = await detect_adaptively(img[y:y + h, x:x + w], escalate=False)
+        except FaceRecognitionError:
+            detection = {"detected": False}
+        if detection["detected"]:
+            region = detection["region"]
+            detection["region"] = [region[0] + x, region[1] + y, region[2], region[3]]
+            return detection, True
+
+    return await detect_adaptively(img), False
+
+def decode_image(image_data: bytes) -> np.ndarray:
+    """Decode uploaded bytes into a BGR image and check it is large enough"""
+    img = cv2.imdecode(np.frombuffer(memoryview(image_data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        raise FaceRecognitionError("Failed to decode image")
+
+    # Check image dimensions
+    height, width = img.shape[:2]
+    if width < MIN_FACE_SIZE[0] or height < MIN_FACE_SIZE[1]:
+        raise FaceRecognitionError(
+            f"Image dimensions too small. Minimum size required: {MIN_FACE_SIZE}"
+        )
+
+    return img
 
-async def process_image(file: UploadFile) -> str:
-    """Process and validate uploaded image with enhanced checks"""
+async def process_image(file: UploadFile) -> Tuple[np.ndarray, bytes]:
+    """
+    Process and validate uploaded image with enhanced checks
+
+    The upload is decoded once, in memory, and the resulting array is passed
+    to every later stage.
+
+    Returns:
+        tuple: (BGR image array, original encoded bytes)
+    """
     try:
         # Validate file size
         file.file.seek(0, 2)
@@ -361,61 +1309,113 @@ async def process_image(file: UploadFile) -> str:
         if file.content_type not in ALLOWED_IMAGE_TYPES:
             raise FaceRecognitionError("Invalid image format. Please upload JPEG or PNG")
 
-        # Create temporary file with enhanced error handling
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.jpg')
-        try:
-            shutil.copyfileobj(file.file, temp_file)
-            temp_file.close()
-
-            # Verify image quality
-            img = cv2.imread(temp_file.name)
-            if img is None:
-                raise FaceRecognitionError("Failed to decode image")
-
-            # Check image dimensions
-            height, width = img.shape[:2]
-            if width < MIN_FACE_SIZE[0] or height < MIN_FACE_SIZE[1]:
-                raise FaceRecognitionError(
-                    f"Image dimensions too small. Minimum size required: {MIN_FACE_SIZE}"
-                )
-
-            return temp_file.name
-        except Exception as e:
-            cleanup_temp_file(temp_file.name)
-            raise FaceRecognitionError(f"Failed to process image: {str(e)}")
+        with stage_seconds.labels("upload").time():
+            image_data = await file.read()
+        with stage_seconds.labels("decode").time():
+            img = await run_blocking(decode_image, image_data)
+        return img, image_data
 
     except Exception as e:
         logger.error(f"Image processing error: {str(e)}")
         raise FaceRecognitionError(str(e))
 
-async def analyze_emotions(image_path: str) -> Dict[str, Any]:
+# Haar cascades are not safe to share between threads, so each pool thread keeps its own
+_thread_local = threading.local()
+
+def detect_faces_haar(img: np.ndarray) -> np.ndarray:
+    """Detect faces with OpenCV's Haar cascade, returning (x, y, w, h) rows"""
+    face_cascade = getattr(_thread_local, "face_cascade", None)
+    if face_cascade is None:
+        face_cascade = cv2.CascadeClassifier(
+            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
+        )
+        _thread_local.face_cascade = face_cascade
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    return np.asarray(face_cascade.detectMultiScale(
+        gray,
+        scaleFactor=1.1,
+        minNeighbors=5,
+        minSize=MIN_FACE_SIZE
+    ))
+
+def emotion_confidence(emotion_scores: Dict[str, float]) -> float:
+    """Score of the dominant emotion on a 0-1 scale (the models report percentages)"""
+    return max(emotion_scores.values()) / 100
+
+async def analyze_with_detector(img: np.ndarray, backend: str, require_face: bool) -> Dict[str, Any]:
+    """Detect with one backend and classify the emotion of its face crop"""
+    detection = await run_inference(inference.extract_face, img, backend, MAX_DETECTION_DIMENSION)
+    if require_face and not detection["detected"]:
+        raise FaceRecognitionError("No face detected")
+    result = await face_batcher.submit(detection["face"], False)
+    return {**result, "detector": backend}
+
+async def race_detectors(
+    img: np.ndarray,
+    backends: List[str],
+    require_face: bool,
+    accept
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    Run emotion analysis with several detector backends concurrently
+
+    Results are collected in the order they finish. Collection stops as soon as
+    accept(result) is true or EMOTION_ANALYSIS_DEADLINE passes; backends that
+    have not finished by then are cancelled and their results discarded.
+
+    Returns:
+        tuple: (results in completion order, backends that were discarded)
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + EMOTION_ANALYSIS_DEADLINE
+    tasks = {
+        asyncio.create_task(analyze_with_detector(img, backend, require_face)): backend
+        for backend in backends
+    }
+    pending = set(tasks)
+    results = []
+
+    try:
+        while pending:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logger.warning(f"Analysis with {tasks[task]} failed: {str(e)}")
+                    continue
+                results.append(result)
+                if accept(result):
+                    return results, [tasks[t] for t in pending]
+        return results, [tasks[t] for t in pending]
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def analyze_emotions(img: np.ndarray) -> Dict[str, Any]:
     """
     Enhanced emotion analysis using multiple models and validation
+
+    The detectors run concurrently. A result that is already above
+    EMOTION_CONFIDENCE_THRESHOLD is returned without waiting for the others;
+    otherwise the scores of every detector that finished in time are averaged.
     """
-    if not DEEPFACE_AVAILABLE:
+    if MOCK_INFERENCE or not inference.DEEPFACE_AVAILABLE:
         logger.warning("DeepFace not available, returning mock emotion data")
-        return get_mock_emotion_data()
+        return get_mock_emotion_data(random_variance=not MOCK_INFERENCE)
         
     try:
-        # Verify image can be processed
-        img = cv2.imread(image_path)
-        if img is None:
-            raise FaceRecognitionError("Could not read image for emotion analysis")
-
         # Collect results from multiple analysis attempts
-        results = []
-        for model in ['opencv', 'retinaface']:
-            try:
-                result = DeepFace.analyze(
-                    img_path=image_path,
-                    actions=['emotion'],
-                    enforce_detection=True,
-                    detector_backend=model,
-                    prog_bar=False
-                )
-                results.append(result[0] if isinstance(result, list) else result)
-            except Exception as e:
-                logger.warning(f"Analysis with {model} failed: {str(e)}")
+        results, discarded = await race_detectors(
+            img,
+            ['opencv', 'retinaface'],
+            require_face=True,
+            accept=lambda result: emotion_confidence(result['emotion']) >= EMOTION_CONFIDENCE_THRESHOLD
+        )
 
         if not results:
             raise FaceRecognitionError("Could not perform reliable emotion analysis")
@@ -436,71 +1436,64 @@ async def analyze_emotions(image_path: str) -> Dict[str, Any]:
         # Identify secondary emotions
         secondary_emotions = [
             emotion for emotion, score in emotion_scores.items()
-            if score >= SECONDARY_EMOTION_THRESHOLD 
+            if score / 100 >= SECONDARY_EMOTION_THRESHOLD
             and emotion != dominant_emotion[0]
         ]
 
         # Prepare detailed analysis results
         return {
-            "status": "success" if dominant_emotion[1] >= EMOTION_CONFIDENCE_THRESHOLD else "low_confidence",
+            "status": "success" if emotion_confidence(emotion_scores) >= EMOTION_CONFIDENCE_THRESHOLD else "low_confidence",
             "dominant_emotion": dominant_emotion[0],
             "emotion_scores": emotion_scores,
             "confidence_level": dominant_emotion[1],
             "secondary_emotions": secondary_emotions,
-            "analysis_method": "multi_model_consensus"
+            "analysis_method": "multi_model_consensus" if len(results) > 1 else "early_exit",
+            "detectors_used": [result["detector"] for result in results],
+            "detectors_discarded": discarded
         }
 
     except Exception as e:
         logger.error(f"Error in emotion analysis: {str(e)}")
         raise FaceRecognitionError(f"Failed to analyze emotions: {str(e)}")
 
-async def detect_face(image_path: str) -> Dict[str, Any]:
+async def detect_face(img: np.ndarray) -> Dict[str, Any]:
     """
     Enhanced face detection using multiple methods and quality assessment
+
+    Detectors are tried in order until one finds a face. The returned dict also
+    carries the aligned crop under 'face' so callers can feed it straight to
+    the emotion and embedding models instead of detecting again.
     """
     try:
         detection_results = {model: False for model in FACE_DETECTION_MODELS}
         face_details = None
+        face = None
 
-        # Try OpenCV Haar Cascade
-        face_cascade = cv2.CascadeClassifier(
-            cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        )
-        img = cv2.imread(image_path)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(
-            gray,
-            scaleFactor=1.1,
-            minNeighbors=5,
-            minSize=MIN_FACE_SIZE
-        )
-        
-        if len(faces) > 0:
-            detection_results['opencv'] = True
-            face_details = {
-                'count': len(faces),
-                'locations': faces.tolist(),
-                'method': 'opencv'
-            }
-
-        # Try other detection methods if DeepFace is available
-        if not detection_results['opencv'] and DEEPFACE_AVAILABLE:
-            for model in ['retinaface', 'mtcnn']:
+        if inference.DEEPFACE_AVAILABLE:
+            for model in FACE_DETECTION_MODELS:
                 try:
-                    result = DeepFace.detect_face(
-                        img_path=image_path,
-                        detector_backend=model,
-                        enforce_detection=False
-                    )
-                    if result:
+                    detection = await run_inference(inference.extract_face, img, model, MAX_DETECTION_DIMENSION)
+                    if detection["detected"]:
                         detection_results[model] = True
+                        face = detection["face"]
                         face_details = {
-                            'count': 1,
+                            'count': len(detection["regions"]),
+                            'locations': detection["regions"],
                             'method': model
                         }
                         break
                 except Exception as e:
                     logger.warning(f"{model} detection failed: {str(e)}")
+        else:
+            # Without DeepFace, fall back to OpenCV's Haar cascade
+            faces = await run_blocking(detect_faces_haar, img)
+            if len(faces) > 0:
+                detection_results['opencv'] = True
+                face_details = {
+                    'count': len(faces),
+                    'locations': faces.tolist(),
+                    'method': 'opencv'
+                }
 
         # Determine overall detection success
         detection_successful = any(detection_results.values())
@@ -510,7 +1503,8 @@ async def detect_face(image_path: str) -> Dict[str, Any]:
             return {
                 'detected': True,
                 'details': face_details,
-                'methods_tried': detection_results
+                'methods_tried': detection_results,
+                'face': face
             }
         else:
             logger.warning("No face detected with any method")
@@ -528,42 +1522,49 @@ async def detect_face(image_path: str) -> Dict[str, Any]:
             'error': str(e)
         }
 
-async def detect_emotions(image_path: str) -> Dict[str, Any]:
+async def detect_emotions(img: np.ndarray) -> Dict[str, Any]:
     """
     Enhanced emotion detection with multiple attempts and validation
+
+    All backends run concurrently under EMOTION_ANALYSIS_DEADLINE; the first
+    confident result wins and slower backends are cancelled.
     """
-    if not DEEPFACE_AVAILABLE:
+    if MOCK_INFERENCE or not inference.DEEPFACE_AVAILABLE:
         logger.warning("DeepFace not available, returning mock emotion data")
-        return get_mock_emotion_data()
+        return get_mock_emotion_data(random_variance=not MOCK_INFERENCE)
         
     try:
-        # Try different detection backends in order of reliability
+        # Detection backends in order of reliability
         backends = ['retinaface', 'opencv', 'mtcnn']
-        
-        for backend in backends:
-            try:
-                result = DeepFace.analyze(
-                    img_path=image_path,
-                    actions=['emotion'],
-                    enforce_detection=False,
-                    detector_backend=backend
-                )
-                
-                emotion_data = result[0] if isinstance(result, list) else result
-                scores = emotion_data["emotion"]
-                
-                # Validate emotion scores
-                if any(scores.values()):  # Check if we got any non-zero scores
-                    return {
-                        "success": True,
-                        "dominant_emotion": emotion_data["dominant_emotion"],
-                        "emotion_scores": scores,
-                        "detector_used": backend
-                    }
-            except Exception as e:
-                logger.warning(f"{backend} detection failed: {str(e)}")
-                continue
-                
+
+        # Run them all at once; a confident result ends the race immediately
+        results, discarded = await race_detectors(
+            img,
+            backends,
+            require_face=False,
+            accept=lambda result: (
+                any(result["emotion"].values())
+                and emotion_confidence(result["emotion"]) >= EMOTION_CONFIDENCE_THRESHOLD
+            )
+        )
+
+        # Check if we got any non-zero scores
+        valid = [result for result in results if any(result["emotion"].values())]
+        if valid:
+            # Take the confident result that ended the race, else the most reliable backend that finished
+            confident = [
+                result for result in valid
+                if emotion_confidence(result["emotion"]) >= EMOTION_CONFIDENCE_THRESHOLD
+            ]
+            emotion_data = confident[0] if confident else min(valid, key=lambda result: backends.index(result["detector"]))
+            return {
+                "success": True,
+                "dominant_emotion": emotion_data["dominant_emotion"],
+                "emotion_scores": emotion_data["emotion"],
+                "detector_used": emotion_data["detector"],
+                "detectors_discarded": discarded
+            }
+
         # If all detectors failed, return a more informative response
         return {
             "success": False,
@@ -582,60 +1583,200 @@ async def detect_emotions(image_path: str) -> Dict[str, Any]:
 
 # API Endpoints
 
+class RequestMetricsMiddleware:
+    """
+    Latency and status of every HTTP request, labelled by route template
+
+    A plain ASGI middleware rather than @app.middleware("http"), which wraps
+    the request's receive channel and hides client disconnects from the
+    endpoints.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the scope
+            route = scope.get("route")
+            route_path = route.path if route is not None else "unmatched"
+            http_request_seconds.labels(scope["method"], route_path).observe(time.perf_counter() - start_time)
+            http_requests.labels(scope["method"], route_path, status).inc()
+
+app.add_middleware(RequestMetricsMiddleware)
+
+@app.get("/metrics")
+async def prometheus_metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/")
 async def read_root() -> Dict[str, str]:
-    """Root endpoint to verify server is running"""
+    """Liveness check: answers as soon as the process is up, while /health tracks model readiness"""
     return {
         "status": "ok",
         "message": "Face recognition server is running",
         "version": "1.0.0",
-        "deepface_available": str(DEEPFACE_AVAILABLE)  # Convert boolean to string
+        "deepface_available": str(inference.DEEPFACE_AVAILABLE)  # Convert boolean to string
     }
 
 @app.get("/health")
 async def health_check() -> Dict[str, Any]:
-    """Enhanced health check endpoint"""
+    """
+    Readiness check for the load balancer: returns 503 until the models are
+    built and warmed and the face gallery is loaded
+    """
     try:
         known_faces_dir = ensure_directories()
         # Count directories instead of files since we're using directories for each person
         face_count = len([d for d in Path(known_faces_dir).iterdir() if d.is_dir()])
 
-        return {
-            "status": "healthy",
+        health = {
+            "status": "ready" if startup_state["ready"] else "starting",
             "timestamp": datetime.now().isoformat(),
             "known_faces_count": face_count,
             "storage_accessible": True,
             "models_available": FACE_DETECTION_MODELS,
+            "inference_workers": startup_state["workers"],
+            "face_index": face_gallery.index.describe(),
+            "micro_batching": face_batcher.stats(),
+            "inference_pool": {
+                "mode": "process" if INFERENCE_WORKER_PROCESSES > 0 else "thread",
+                "size": INFERENCE_WORKER_PROCESSES or INFERENCE_POOL_SIZE,
+                "queue_depth": INFERENCE_QUEUE_DEPTH
+            },
             "encryption_enabled": True,
-            "deepface_available": str(DEEPFACE_AVAILABLE)  # Convert to string
+            "deepface_available": str(inference.DEEPFACE_AVAILABLE)  # Convert to string
         }
+        if startup_state["error"]:
+            health["status"] = "unhealthy"
+            health["error"] = startup_state["error"]
+
+        if health["status"] != "ready":
+            return JSONResponse(status_code=503, content=health)
+        return health
     except Exception as e:
         logger.error(f"Health check failed: {str(e)}")
-        return {
-            "status": "unhealthy",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "unhealthy",
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }
+        )
+
+def store_known_face(image_data: bytes, encrypted_name: str, reference_id: Optional[str] = None) -> str:
+    """
+    Write a new known face to storage
+
+    Args:
+        image_data (bytes): The validated upload
+        encrypted_name (str): The identifier returned by encrypt_name
+        reference_id (str): Set for additional reference images of an existing
+            person; the first image is always stored as reference.jpg
+
+    Returns:
+        str: Path of the saved reference image
+    """
+    # Step 2: Create a directory for this person using the encrypted identifier
+    person_dir = os.path.join(KNOWN_FACES_DIR, encrypted_name)
+    os.makedirs(person_dir, exist_ok=True)
+
+    # Step 3: Save an unencrypted copy for DeepFace to use (needed for face recognition)
+    reference_name = REFERENCE_IMAGE_NAME if reference_id is None else f"reference-{reference_id}.jpg"
+    reference_path = os.path.join(person_dir, reference_name)
+    with open(reference_path, "wb") as f:
+        f.write(image_data)
+
+    # Step 4: Encrypt the original image for secure storage
+    encrypted_image = encryption_service.encrypt_image(image_data)
+
+    # Step 5: Store the encrypted image in a separate directory
+    encrypted_dir = os.path.join(ENCRYPTED_FACES_DIR, encrypted_name)
+    os.makedirs(encrypted_dir, exist_ok=True)
+    encrypted_path = os.path.join(encrypted_dir, "encrypted.bin" if reference_id is None else f"encrypted-{reference_id}.bin")
+
+    with open(encrypted_path, "wb") as f:
+        f.write(encrypted_image)
+
+    return reference_path
+
+def append_embedding(person_dir: str, embedding: np.ndarray) -> np.ndarray:
+    """
+    Add one reference embedding to a person's stored embeddings
+
+    Returns:
+        np.ndarray: All of the person's (K, D) reference embeddings
+    """
+    existing = FaceGallery.read_embeddings(Path(person_dir))
+    embeddings = embedding[np.newaxis] if existing is None else np.vstack([existing, embedding])
+    np.save(os.path.join(person_dir, EMBEDDINGS_FILE_NAME), embeddings)
+    return embeddings
+
+# Serialises read-modify-write of embeddings.npy when references are added; created on first use
+_reference_lock: Optional[asyncio.Lock] = None
+
+@app.get("/stats/detectors")
+async def detector_stats() -> Dict[str, Any]:
+    """Current detector selection policy and per-detector rolling statistics"""
+    return detector_selector.stats()
+
+@app.get("/stats/sessions")
+async def session_stats() -> Dict[str, Any]:
+    """Tracking sessions and the identification work their tracks saved"""
+    return session_registry.stats()
+
+@app.get("/stats/admission")
+async def admission_stats() -> Dict[str, Any]:
+    """Analyses running and waiting, and how many were refused or cancelled"""
+    return admission.stats()
+
+@app.get("/stats/quality")
+async def quality_stats() -> Dict[str, Any]:
+    """Current quality tier ceiling, the queue latency driving it and tiers served"""
+    return quality_governor.stats()
+
+@app.get("/stats/cache")
+async def cache_stats() -> Dict[str, Any]:
+    """Near-duplicate frame cache and decrypted-name cache sizes and hit/miss counters"""
+    stats = frame_cache.stats()
+    stats["decrypted_names"] = encryption_service.name_cache_stats()
+    return stats
 
 @app.post("/add-known-face")
 async def add_known_face(
     file: UploadFile = File(...),
-    name: str = Form(...),
-    background_tasks: BackgroundTasks = None
-) -> Dict[str, str]:
+    name: str = Form(...)
+) -> Dict[str, Any]:
     """Add a new known face with encryption for privacy protection"""
     logger.info(f"Received request to add known face. Name: {name}, File: {file.filename}")
-    temp_file_path = None
 
     try:
         if not name or not name.strip():
             raise HTTPException(status_code=400, detail="Name is required")
 
         # Process and validate the image
-        temp_file_path = await process_image(file)
+        img, image_data = await process_image(file)
 
-        # Enhanced face detection to ensure image quality
-        detection_result = await detect_face(temp_file_path)
+        # Enhanced face detection to ensure image quality; the aligned crop is reused below
+        detection_result = await detect_face(img)
+        face = detection_result.pop('face', None)
         if not detection_result['detected']:
             raise HTTPException(
                 status_code=400,
@@ -643,36 +1784,24 @@ async def add_known_face(
             )
 
         # Step 1: Encrypt the person's name to get a secure identifier
-        encrypted_name = encryption_service.encrypt_name(name.strip())
+        encrypted_name = await run_blocking(encryption_service.encrypt_name, name.strip())
         
-        # Step 2: Create a directory for this person using the encrypted identifier
-        person_dir = os.path.join(KNOWN_FACES_DIR, encrypted_name)
-        os.makedirs(person_dir, exist_ok=True)
+        # Steps 2-5: Store the reference and the encrypted original off the event loop
+        reference_path = await run_blocking(store_known_face, image_data, encrypted_name)
 
-        # Step 3: Save an unencrypted copy for DeepFace to use (needed for face recognition)
-        reference_path = os.path.join(person_dir, "reference.jpg")
-        shutil.copy2(temp_file_path, reference_path)
-        
-        # Step 4: Read the image for encryption
-        with open(temp_file_path, "rb") as f:
-            image_data = f.read()
-        
-        # Step 5: Encrypt the original image for secure storage
-        encrypted_image = encryption_service.encrypt_image(image_data)
-        
-        # Step 6: Store the encrypted image in a separate directory
-        encrypted_dir = os.path.join(ENCRYPTED_FACES_DIR, encrypted_name)
-        os.makedirs(encrypted_dir, exist_ok=True)
-        encrypted_path = os.path.join(encrypted_dir, "encrypted.bin")
-        
-        with open(encrypted_path, "wb") as f:
-            f.write(encrypted_image)
+        # Compute the reference embedding once so recognition never re-embeds this image
+        if inference.DEEPFACE_AVAILABLE:
+            embedding = (await face_batcher.submit(face, True))["embedding"]
+            await run_blocking(np.save, os.path.join(os.path.dirname(reference_path), EMBEDDINGS_FILE_NAME), embedding[np.newaxis])
+            face_gallery.add(encrypted_name, embedding)
+            # Faces tracked or cached as unknown may be the person just enrolled
+            session_registry.invalidate_tracks()
+            frame_cache.clear()
+
+        face_catalog.add(encrypted_name, name.strip(), reference_path)
+        face_catalog.follow_publish(*face_gallery.publish())
 
         logger.info(f"Successfully added face with encrypted name ID: {encrypted_name}")
-        
-        # Clean up the temporary file
-        if background_tasks:
-            background_tasks.add_task(cleanup_temp_file, temp_file_path)
 
         return {
             "status": "success",
@@ -683,97 +1812,279 @@ async def add_known_face(
         }
 
     except HTTPException as he:
-        if temp_file_path:
-            cleanup_temp_file(temp_file_path)
         raise he
     except Exception as e:
-        if temp_file_path:
-            cleanup_temp_file(temp_file_path)
         error_msg = f"Error adding known face: {str(e)}"
+        errors.labels("enroll").inc()
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+def read_enrollment_archive(archive, filename: str) -> List[Tuple[str, str, bytes]]:
+    """
+    Read the images in a zip or tar archive laid out like public/known_faces
+
+    Each image's parent directory is the person's name (<Name>/photo.jpg);
+    images at the top level are named after their file.
+
+    Returns:
+        list: (name, file path inside the archive, image bytes)
+    """
+    images = []
+    total_size = 0
+
+    def collect(path: str, size: int, read) -> None:
+        nonlocal total_size
+        parts = Path(path).parts
+        if Path(path).suffix.lower() not in IMAGE_SUFFIXES or "__MACOSX" in parts:
+            return
+        if len(images) >= MAX_BATCH_FILES:
+            raise FaceRecognitionError(f"Archive holds more than {MAX_BATCH_FILES} images")
+        if size <= MAX_IMAGE_SIZE:
+            total_size += size
+            if total_size > MAX_BATCH_BYTES:
+                raise FaceRecognitionError(f"Archive images exceed {MAX_BATCH_BYTES // (1024 * 1024)}MB uncompressed")
+        name = parts[-2] if len(parts) > 1 else Path(path).stem
+        # Oversized entries are not read; enroll_batch reports them
+        images.append((name, path, read() if size <= MAX_IMAGE_SIZE else b""))
+
+    archive.seek(0)
+    if zipfile.is_zipfile(archive):
+        archive.seek(0)
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    collect(info.filename, info.file_size, lambda: zf.read(info))
+    else:
+        archive.seek(0)
+        try:
+            tf = tarfile.open(fileobj=archive)
+        except tarfile.TarError:
+            raise FaceRecognitionError(f"{filename} is not a zip or tar archive")
+        with tf:
+            for member in tf.getmembers():
+                if member.isfile():
+                    collect(member.name, member.size, lambda: tf.extractfile(member).read())
+    return images
+
+async def enroll_batch(items: List[Tuple[str, str, bytes]]) -> Dict[str, Any]:
+    """
+    Enroll many people at once
+
+    Images are decoded, checked for a face and embedded concurrently, but at
+    most ENROLL_CONCURRENCY at a time, so only that many decoded frames and
+    face crops are in memory at once; each image keeps just its embedding.
+    Every name is encrypted and stored in one identity-store transaction and
+    the gallery is published once. A bad image is reported and never stops
+    the rest of the batch.
+
+    Args:
+        items (list): (name, file name, encoded image bytes)
+
+    Returns:
+        dict: "enrolled" and "failed" entries, failures with per-file reasons
+    """
+    failed = []
+    slots = asyncio.Semaphore(ENROLL_CONCURRENCY)
+
+    async def check(name: str, filename: str, image_data: bytes) -> Optional[Dict[str, Any]]:
+        try:
+            if not name or not name.strip():
+                raise FaceRecognitionError("Name is required")
+            if not image_data or len(image_data) > MAX_IMAGE_SIZE:
+                raise FaceRecognitionError("Image is empty or exceeds maximum allowed size (10MB)")
+            async with slots:
+                img = await run_blocking(decode_image, image_data)
+                detection = await detect_face(img)
+                if not detection["detected"]:
+                    raise FaceRecognitionError("No face detected in image")
+                embedding = None
+                if inference.DEEPFACE_AVAILABLE:
+                    embedding = (await face_batcher.submit(detection["face"], True))["embedding"]
+            return {"name": name.strip(), "file": filename, "data": image_data, "embedding": embedding}
+        except Exception as e:
+            failed.append({"name": name, "file": filename, "error": str(e)})
+            return None
+
+    checked = await asyncio.gather(*[check(*item) for item in items])
+
+    # Every usable image of a name becomes one of that person's references
+    people: Dict[str, List[Dict[str, Any]]] = {}
+    for entry in checked:
+        if entry is not None:
+            people.setdefault(entry["name"], []).append(entry)
+
+    enrolled = []
+    if people:
+        # All mappings are written in a single transaction
+        encrypted_ids = await run_blocking(encryption_service.encrypt_names, list(people))
+
+        async def store(name: str, entries: List[Dict[str, Any]], encrypted_id: str) -> None:
+            try:
+                reference_path = await run_blocking(store_known_face, entries[0]["data"], encrypted_id)
+                for entry in entries[1:]:
+                    await run_blocking(store_known_face, entry["data"], encrypted_id, uuid.uuid4().hex[:12])
+                if inference.DEEPFACE_AVAILABLE:
+                    embeddings = np.stack([entry["embedding"] for entry in entries])
+                    await run_blocking(np.save, os.path.join(os.path.dirname(reference_path), EMBEDDINGS_FILE_NAME), embeddings)
+                    face_gallery.add(encrypted_id, embeddings)
+                face_catalog.add(encrypted_id, name, reference_path)
+                enrolled.extend({"name": name, "file": entry["file"]} for entry in entries)
+            except Exception as e:
+                failed.extend({"name": name, "file": entry["file"], "error": str(e)} for entry in entries)
+                await remove_identity(encrypted_id, publish=False)
+
+        await asyncio.gather(*[
+            store(name, entries, encrypted_id) for (name, entries), encrypted_id in zip(people.items(), encrypted_ids)
+        ])
+
+        session_registry.invalidate_tracks()
+        frame_cache.clear()
+        face_catalog.follow_publish(*face_gallery.publish())
+
+    logger.info(f"Batch enrollment: {len(enrolled)} images enrolled for {len(people)} people, {len(failed)} failed")
+    return {"enrolled": enrolled, "failed": failed}
+
+@app.post("/add-known-faces/batch")
+async def add_known_faces_batch(
+    files: List[UploadFile] = File([]),
+    names: List[str] = Form([]),
+    archive: Optional[UploadFile] = File(None)
+) -> Dict[str, Any]:
+    """
+    Enroll many known faces in one request
+
+    Either send files with a matching names list (one name per file), or a
+    zip/tar archive laid out as <Name>/*.jpg. Several images with the same
+    name become references of one person. Failures are reported per file.
+    """
+    try:
+        items = []
+        rejected = []
+        if files:
+            if not names or len(names) != len(files):
+                raise HTTPException(status_code=400, detail="Provide one name per file")
+            if len(files) > MAX_BATCH_FILES:
+                raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_FILES} files per batch")
+            if sum(upload.size or 0 for upload in files) > MAX_BATCH_BYTES:
+                raise HTTPException(status_code=400,
+                                    detail=f"Batch images exceed {MAX_BATCH_BYTES // (1024 * 1024)}MB in total")
+            for upload, name in zip(files, names):
+                if upload.content_type not in ALLOWED_IMAGE_TYPES:
+                    rejected.append({"name": name, "file": upload.filename,
+                                     "error": "Invalid image format. Please upload JPEG or PNG"})
+                else:
+                    items.append((name, upload.filename, await upload.read()))
+
+        if archive is not None:
+            try:
+                items.extend(await run_blocking(read_enrollment_archive, archive.file, archive.filename))
+            except FaceRecognitionError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+        if not items and not rejected:
+            raise HTTPException(status_code=400, detail="No images provided")
+
+        result = await enroll_batch(items)
+        result["failed"] = rejected + result["failed"]
+        return {
+            "status": "success" if not result["failed"] else "partial",
+            "enrolled_count": len(result["enrolled"]),
+            "failed_count": len(result["failed"]),
+            **result
+        }
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        error_msg = f"Error adding known faces: {str(e)}"
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
 @app.get("/known-faces")
-async def list_known_faces() -> Dict[str, Any]:
-    """List known faces with decrypted names for display"""
+async def list_known_faces(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    count_only: bool = False
+) -> Dict[str, Any]:
+    """
+    List known faces with decrypted names for display
+
+    Served from the in-memory catalog. Without limit every face is returned;
+    with limit the response carries next_cursor for the following page.
+    count_only returns just the count. Responses carry an ETag, and a
+    matching If-None-Match gets 304 Not Modified.
+    """
     try:
-        known_faces_path = Path(KNOWN_FACES_DIR)
-        if not known_faces_path.exists():
+        await run_blocking(face_catalog.refresh_if_stale, KNOWN_FACES_DIR)
+
+        etag = face_catalog.etag(limit, cursor, count_only)
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = "no-cache"
+
+        if count_only:
             return {
-                "count": 0,
-                "faces": [],
+                "count": len(face_catalog),
                 "status": "success"
             }
 
-        faces = []
-        # Scan directories rather than files since we're now using directories for each person
-        for person_dir in [d for d in known_faces_path.iterdir() if d.is_dir()]:
-            try:
-                # The directory name is the encrypted ID
-                encrypted_id = person_dir.name
-                
-                # Decrypt the name for display using our encryption service
-                original_name = encryption_service.decrypt_name(encrypted_id)
-                
-                # Find the reference image to get metadata
-                reference_file = person_dir / "reference.jpg"
-                if reference_file.exists():
-                    stat = reference_file.stat()
-                    faces.append({
-                        "name": original_name,
-                        "added_date": datetime.fromtimestamp(stat.st_ctime).isoformat(),
-                        "last_modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                        "file_size": stat.st_size
-                    })
-            except Exception as e:
-                logger.warning(f"Error getting metadata for {person_dir}: {str(e)}")
+        try:
+            faces, next_cursor = face_catalog.page(limit, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
-        return {
-            "count": len(faces),
-            "faces": sorted(faces, key=lambda x: x["added_date"], reverse=True),
+        result = {
+            "count": len(face_catalog),
+            "faces": faces,
             "status": "success"
         }
+        if limit is not None:
+            result["next_cursor"] = next_cursor
+        return result
 
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logger.error(f"Error listing known faces: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to list known faces")
 
+async def remove_identity(encrypted_id: str, publish: bool = True) -> None:
+    """Remove an enrolled identity from the gallery, disk and the identity store"""
+    face_gallery.remove(encrypted_id)
+    face_catalog.remove(encrypted_id)
+    if publish:
+        face_catalog.follow_publish(*face_gallery.publish())
+        session_registry.invalidate_tracks()
+        frame_cache.clear()
+
+    # Delete the reference and encrypted directories
+    for directory in (Path(KNOWN_FACES_DIR) / encrypted_id, Path(ENCRYPTED_FACES_DIR) / encrypted_id):
+        if directory.exists():
+            await run_blocking(shutil.rmtree, directory)
+
+    # Delete from mapping
+    await run_blocking(encryption_service.delete_name, encrypted_id)
+
 @app.delete("/known-faces/{name}")
 async def delete_known_face(name: str) -> Dict[str, str]:
     """Delete a known face from the database, including encrypted data"""
     try:
-        # Find the encrypted ID matching this name from the mapping
-        encrypted_id = None
-        for id, encrypted_name in encryption_service.name_mapping.items():
-            try:
-                decrypted = encryption_service.decrypt_name(id)
-                if decrypted == name:
-                    encrypted_id = id
-                    break
-            except Exception:
-                continue
-        
-        if not encrypted_id:
+        # Look the name up through the keyed name index instead of decrypting every entry
+        matches = await run_blocking(encryption_service.find_ids_by_name, name)
+
+        if not matches:
             raise HTTPException(
                 status_code=404,
                 detail=f"No known face found for {name}"
             )
 
-        # Delete reference directory
-        person_dir = Path(KNOWN_FACES_DIR) / encrypted_id
-        if person_dir.exists():
-            shutil.rmtree(person_dir)
-        
-        # Delete encrypted directory
-        encrypted_dir = Path(ENCRYPTED_FACES_DIR) / encrypted_id
-        if encrypted_dir.exists():
-            shutil.rmtree(encrypted_dir)
-            
-        # Delete from mapping
-        if encrypted_id in encryption_service.name_mapping:
-            del encryption_service.name_mapping[encrypted_id]
-            encryption_service._save_mapping()
-        
+        # Several people can share a name; delete them individually via /known-faces/by-id
+        encrypted_id = matches[0]
+        await remove_identity(encrypted_id)
+
         logger.info(f"Successfully deleted face for {name}")
         
         return {
@@ -788,139 +2099,505 @@ async def delete_known_face(name: str) -> Dict[str, str]:
         logger.error(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
 
-@app.post("/analyze-face")
-async def analyze_face(
-    file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = None
+@app.delete("/known-faces/by-id/{identity_id}")
+async def delete_known_face_by_id(identity_id: str) -> Dict[str, str]:
+    """Delete a known face by its identity id"""
+    try:
+        if identity_id not in encryption_service.name_mapping and \
+                await run_blocking(encryption_service.store.get, identity_id) is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No known face found with id {identity_id}"
+            )
+
+        await remove_identity(identity_id)
+        logger.info(f"Successfully deleted face with ID: {identity_id}")
+
+        return {
+            "status": "success",
+            "message": f"Successfully deleted face with id {identity_id}"
+        }
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        error_msg = f"Error deleting known face: {str(e)}"
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+@app.post("/known-faces/by-id/{identity_id}/references")
+async def add_reference(
+    identity_id: str,
+    file: UploadFile = File(...)
 ) -> Dict[str, Any]:
     """
-    Analyzes a face image with enhanced error handling and decrypts any recognized person's name
-    """
-    start_time = time.time()
-    logger.info(f"Starting face analysis for file: {file.filename}")
-    temp_file_path = None
+    Add another reference image to an enrolled person
 
+    The person's embeddings are re-aggregated into prototypes, so recognition
+    cost does not grow with the number of references.
+    """
+    global _reference_lock
     try:
-        # Process and validate the image
-        temp_file_path = await process_image(file)
-        
-        # Log image properties for debugging
-        img = cv2.imread(temp_file_path)
-        if img is not None:
-            height, width = img.shape[:2]
-            logger.info(f"Image dimensions: {width}x{height}")
-
-        # If DeepFace is not available, return mock data
-        if not DEEPFACE_AVAILABLE:
-            mock_data = get_mock_emotion_data()
-            logger.info("DeepFace not available, returning mock data")
-            
-            # Clean up temporary file
-            if temp_file_path and background_tasks:
-                background_tasks.add_task(cleanup_temp_file, temp_file_path)
-                
-            return mock_data
-
-        # Try multiple face detection methods
-        logger.info("Starting DeepFace analysis...")
-        try:
-            result = DeepFace.analyze(
-                img_path=temp_file_path,
-                actions=['emotion'],
-                enforce_detection=False,
-                detector_backend='retinaface'  # Try a more robust detector
+        # Only ids from the identity store may name a directory, so "." or ".." never reach a path
+        if identity_id not in encryption_service.name_mapping and \
+                await run_blocking(encryption_service.store.get, identity_id) is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No known face found with id {identity_id}"
             )
-        except Exception as e:
-            logger.warning(f"RetinaFace detection failed: {str(e)}")
-            # Fallback to OpenCV
-            result = DeepFace.analyze(
-                img_path=temp_file_path,
-                actions=['emotion'],
-                enforce_detection=False,
-                detector_backend='opencv'
+        person_dir = os.path.join(KNOWN_FACES_DIR, identity_id)
+        if not os.path.isdir(person_dir):
+            raise HTTPException(
+                status_code=404,
+                detail=f"No known face found with id {identity_id}"
+            )
+
+        img, image_data = await process_image(file)
+        detection_result = await detect_face(img)
+        face = detection_result.pop('face', None)
+        if not detection_result['detected']:
+            raise HTTPException(
+                status_code=400,
+                detail="No face detected in image. Please ensure the face is clearly visible, well-lit, and facing the camera."
             )
 
-# Extract emotion data with detailed logging
-        emotion_data = result[0] if isinstance(result, list) else result
-        dominant_emotion = emotion_data["dominant_emotion"]
-        emotion_scores = emotion_data["emotion"]
+        await run_blocking(store_known_face, image_data, identity_id, uuid.uuid4().hex[:12])
 
-        logger.info(f"Detected emotion scores: {emotion_scores}")
-        logger.info(f"Dominant emotion: {dominant_emotion}")
-        
-        # Attempt to recognize person using face recognition
-        recognized_person = "Unknown"
-        recognized_id = None
-        
+        reference_count = None
+        if inference.DEEPFACE_AVAILABLE:
+            embedding = (await face_batcher.submit(face, True))["embedding"]
+            if _reference_lock is None:
+                _reference_lock = asyncio.Lock()
+            async with _reference_lock:
+                embeddings = await run_blocking(append_embedding, person_dir, embedding)
+                face_gallery.add(identity_id, embeddings)
+            reference_count = len(embeddings)
+            face_catalog.follow_publish(*face_gallery.publish())
+            session_registry.invalidate_tracks()
+            frame_cache.clear()
+
+        logger.info(f"Added reference image for ID: {identity_id}")
+
+        return {
+            "status": "success",
+            "message": f"Added reference image for id {identity_id}",
+            "reference_count": reference_count,
+            "detection_details": detection_result
+        }
+
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        error_msg = f"Error adding reference image: {str(e)}"
+        logger.error(error_msg)
+        raise HTTPException(status_code=500, detail=error_msg)
+
+async def analyze_frame(img: np.ndarray, image_size: int, start_time: float,
+                        session: Optional[TrackingSession] = None, quality: str = "auto") -> Dict[str, Any]:
+    """
+    Emotion analysis and recognition for one decoded frame
+
+    Shared by the /analyze-face upload endpoint and the /ws/analyze stream.
+    With a tracking session, a face that is still on its track keeps the
+    identity recognised earlier and only the emotion model runs on it.
+
+    The quality tier is the requested one, capped by the quality governor
+    while the server is queueing:
+    - fast: opencv detection and the emotion model only, no recognition
+    - standard: adaptive detection, emotion and recognition in one batch
+    - full: standard plus the multi-detector emotion consensus of analyze_emotions
+    The tier that served the frame is reported as "quality_tier".
+    """
+    # Log image properties for debugging
+    height, width = img.shape[:2]
+    logger.info(f"Image dimensions: {width}x{height}")
+    tier = quality_governor.choose(quality)
+    # Every frame keeps its stream alive, including cache hits and fast-tier frames that record nothing
+    if session is not None:
+        session.touch()
+
+    # Without DeepFace, or in mock mode, return mock data
+    if MOCK_INFERENCE or not inference.DEEPFACE_AVAILABLE:
+        mock_data = get_mock_emotion_data(random_variance=not MOCK_INFERENCE)
+        mock_data["quality_tier"] = tier
+        mock_responses.inc()
+        logger.info("DeepFace not available, returning mock data")
+        return mock_data
+
+    # Pick up faces added or deleted by other processes; tracked and cached identities may be stale then
+    if await run_blocking(face_gallery.refresh_if_stale, KNOWN_FACES_DIR):
+        session_registry.invalidate_tracks()
+        frame_cache.clear()
+
+    # A frame that is practically identical to a recent one from the same session gets the same answer.
+    # Results name a person, so they are never shared between sessions or across gallery versions.
+    frame_hash = None
+    cache_scope = None if session is None else (session.session_id, face_gallery.version)
+    if frame_cache.enabled and cache_scope is not None:
+        with stage_seconds.labels("frame_hash").time():
+            frame_hash = await run_blocking(dhash, img)
+        # Only a result of at least the same tier may answer this frame
+        cached = frame_cache.get(
+            frame_hash, cache_scope,
+            accept=lambda result: QUALITY_TIERS.index(result["quality_tier"]) >= QUALITY_TIERS.index(tier)
+        )
+        frame_cache_lookups.labels("miss" if cached is None else "hit").inc()
+        if cached is not None:
+            response_data, distance = cached
+            response_data["processing_time"] = round(time.time() - start_time, 2)
+            response_data["debug_info"]["cache"] = {"hit": True, "hash_distance": distance}
+            stage_seconds.labels("total").observe(time.time() - start_time)
+            return response_data
+
+    # The full tier's consensus runs alongside the standard analysis
+    consensus = asyncio.ensure_future(analyze_emotions(img)) if tier == 'full' else None
+    try:
+        # Detect and align the face once with the cheapest detector that works on our cameras
+        logger.info("Starting DeepFace analysis...")
+        with stage_seconds.labels("detection").time():
+            if tier == 'fast':
+                detection = await run_inference(inference.extract_face, img, FAST_TIER_DETECTOR, MAX_DETECTION_DIMENSION)
+                detection["detectors_tried"] = [FAST_TIER_DETECTOR]
+                region_detection = False
+            else:
+                detection, region_detection = await detect_tracked(img, session)
+        face_box = detection["region"] if detection["detected"] else None
+        # A face still on its track keeps its identity; the fast tier never identifies
+        on_track = session is not None and not session.needs_identification(face_box)
+        identify = tier != 'fast' and not on_track
+        identifications.labels("identified" if identify else "tracked" if on_track else "skipped").inc()
+
+        # Emotion and the recognition embedding come from one batched model call
+        with stage_seconds.labels("inference").time():
+            prediction = await face_batcher.submit(detection["face"], identify and len(face_gallery) > 0)
+    except BaseException:
+        if consensus is not None:
+            consensus.cancel()
+        raise
+
+    # Extract emotion data with detailed logging
+    dominant_emotion = prediction["dominant_emotion"]
+    emotion_scores = prediction["emotion"]
+    consensus_info = None
+    if consensus is not None:
         try:
-            # We'll search through the reference directories for matches
-            for person_dir in Path(KNOWN_FACES_DIR).iterdir():
-                if not person_dir.is_dir():
-                    continue
-                
-                encrypted_id = person_dir.name
-                reference_file = person_dir / "reference.jpg"
-                
-                if not reference_file.exists():
-                    continue
-                
-                try:
-                    # Compare the uploaded face to this reference
-                    verify_result = DeepFace.verify(
-                        img1_path=temp_file_path,
-                        img2_path=str(reference_file),
-                        enforce_detection=False,
-                        model_name='VGG-Face'
-                    )
-                    
-                    if verify_result.get("verified", False):
-                        # We found a match! Decrypt the name
-                        recognized_id = encrypted_id
-                        recognized_person = encryption_service.decrypt_name(encrypted_id)
-                        logger.info(f"Recognized person: {recognized_person}")
-                        break
-                except Exception as e:
-                    logger.warning(f"Error comparing with reference {reference_file}: {str(e)}")
+            consensus_result = await consensus
+            dominant_emotion = consensus_result["dominant_emotion"]
+            emotion_scores = consensus_result["emotion_scores"]
+            consensus_info = {
+                "analysis_method": consensus_result["analysis_method"],
+                "detectors_used": consensus_result["detectors_used"],
+                "detectors_discarded": consensus_result["detectors_discarded"],
+            }
+        except FaceRecognitionError as e:
+            # No detector found a face; keep the single-model scores
+            consensus_info = {"error": str(e)}
+
+    logger.info(f"Detected emotion scores: {emotion_scores}")
+    logger.info(f"Dominant emotion: {dominant_emotion}")
+
+    # Attempt to recognize person using face recognition
+    recognized_person = "Unknown"
+    recognized_id = None
+    recognition_distance = None
+
+    if on_track:
+        # Same face as the previous frame: reuse the identity recognised for the track
+        track = session.follow(face_box)
+        recognized_person, recognition_distance = track.person, track.distance
+    elif identify:
+        try:
+            # Compare the probe embedding against every known face at once
+            if prediction["embedding"] is not None:
+                with stage_seconds.labels("recognition").time():
+                    recognized_id, recognition_distance = await run_blocking(face_gallery.match, prediction["embedding"])
+                if recognized_id:
+                    with stage_seconds.labels("decrypt").time():
+                        recognized_person = await run_blocking(encryption_service.decrypt_name, recognized_id)
+                    logger.info(f"Recognized person: {recognized_person}")
         except Exception as e:
+            errors.labels("recognition").inc()
             logger.warning(f"Error during face recognition: {str(e)}")
             # Continue with unknown person if recognition fails
 
-        # Prepare response with detailed information
-        response_data = {
-            "status": "success",
-            "dominant_emotion": dominant_emotion,
-            "emotion_scores": emotion_scores,
-            "person": recognized_person,  # Return the decrypted name
-            "processing_time": round(time.time() - start_time, 2),
-            "debug_info": {
-                "image_size": os.path.getsize(temp_file_path),
-                "image_dimensions": f"{width}x{height}" if 'width' in locals() else "unknown"
-            }
+        if session is not None:
+            session.identified(face_box, recognized_id, recognized_person, recognition_distance)
+
+    # Prepare response with detailed information
+    response_data = {
+        "status": "success",
+        "dominant_emotion": dominant_emotion,
+        "emotion_scores": emotion_scores,
+        "person": recognized_person,  # Return the decrypted name
+        "quality_tier": tier,
+        "processing_time": round(time.time() - start_time, 2),
+        "debug_info": {
+            "image_size": image_size,
+            "image_dimensions": f"{width}x{height}",
+            "detector_used": detection["detector"],
+            "detectors_tried": detection["detectors_tried"],
+            "face_detected": detection["detected"],
+            "face_region": detection["region"],
+            "recognition_distance": recognition_distance
         }
-        
-        # Clean up temporary file
-        if temp_file_path and background_tasks:
-            background_tasks.add_task(cleanup_temp_file, temp_file_path)
+    }
+    if consensus_info is not None:
+        response_data["debug_info"]["consensus"] = consensus_info
+
+    if frame_hash is not None:
+        frame_cache.put(frame_hash, response_data, cache_scope)
+    stage_seconds.labels("total").observe(time.time() - start_time)
+
+    if session is not None and (identify or on_track):
+        session.record_frame(identify, time.time() - start_time, region_detection)
+        response_data["debug_info"]["tracking"] = {
+            "session_id": session.session_id,
+            "identified": identify,
+            "track_confidence": None if session.track is None else round(session.track.confidence, 3)
+        }
+
+    return response_data
+
+@app.post("/analyze-face")
+async def analyze_face(
+    request: Request,
+    file: UploadFile = File(...),
+    session_id: Optional[str] = Form(None),
+    quality: str = Form("auto")
+) -> Dict[str, Any]:
+    """
+    Analyzes a face image with enhanced error handling and decrypts any recognized person's name
+
+    Clients that poll with the same session_id get per-session face tracking
+    and near-duplicate frame caching.
+    quality picks the tier (fast, standard, full, or auto for the server
+    default); the server may serve a lower one while it is queueing.
+    Requests pass admission control first: a saturated server answers 503
+    with Retry-After at once instead of queueing, and the analysis is
+    cancelled if the client disconnects. The per-client share (429) applies
+    per session_id only; the client address is not used, since kiosks behind
+    one proxy or NAT share it.
+    """
+    start_time = time.time()
+    logger.info(f"Starting face analysis for file: {file.filename}")
+    if not valid_quality(quality):
+        raise HTTPException(status_code=400, detail=f"quality must be auto or one of {QUALITY_TIERS}")
+
+    async def admitted_analysis() -> Dict[str, Any]:
+        wait_start = time.perf_counter()
+        async with admission.admit(session_id):
+            wait_seconds = time.perf_counter() - wait_start
+            stage_seconds.labels("admission").observe(wait_seconds)
+            quality_governor.observe(wait_seconds)
+            return await analyze_upload(file, session_id, start_time, quality)
+
+    analysis = asyncio.ensure_future(admitted_analysis())
+    try:
+        if not await finish_unless_disconnected(request, analysis):
+            logger.info("Client disconnected, face analysis cancelled")
+            return Response(status_code=CLIENT_CLOSED_REQUEST)
+        return analysis.result()
+    except ServerOverloaded as e:
+        admission_rejections.labels(e.reason).inc()
+        logger.warning(f"Face analysis refused: {str(e)}")
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+async def analyze_upload(file: UploadFile, session_id: Optional[str], start_time: float, quality: str) -> Dict[str, Any]:
+    """Decode and analyse one uploaded frame; failures become HTTP 500"""
+    img = None
 
-        return response_data
+    try:
+        # Decode the upload once; every later stage works on this array
+        img, image_data = await process_image(file)
+        session = session_registry.get(session_id) if session_id else None
+        return await analyze_frame(img, len(image_data), start_time, session, quality)
 
     except Exception as e:
+        errors.labels("analyze").inc()
         logger.error(f"Error during face analysis: {str(e)}")
         error_details = str(e)
-        if temp_file_path:
-            try:
-                img = cv2.imread(temp_file_path)
-                if img is not None:
-                    error_details += f" Image dimensions: {img.shape}"
-            except:
-                pass
-            cleanup_temp_file(temp_file_path)
-        
+        if img is not None:
+            error_details += f" Image dimensions: {img.shape}"
+
         raise HTTPException(
             status_code=500,
             detail=f"Face analysis failed: {error_details}"
         )
 
+class LatestFrameSlot:
+    """
+    Single-slot mailbox for a camera stream
+
+    A new frame replaces any frame that has not been picked up yet, so a slow
+    analysis never builds a queue of outdated images.
+    """
+
+    def __init__(self):
+        self._frame: Optional[bytes] = None
+        self._ready = asyncio.Event()
+        self.received = 0
+        self.dropped = 0
+        self.closed = False
+
+    def put(self, frame: bytes) -> None:
+        if self._frame is not None:
+            self.dropped += 1
+        self._frame = frame
+        self.received += 1
+        self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def take(self) -> Optional[bytes]:
+        """Wait for the newest frame; None once the stream is closed"""
+        await self._ready.wait()
+        self._ready.clear()
+        frame, self._frame = self._frame, None
+        return frame
+
+@app.websocket("/ws/analyze")
+async def analyze_stream(websocket: WebSocket) -> None:
+    """
+    Streaming counterpart of /analyze-face
+
+    The client sends encoded JPEG/PNG frames as binary messages and receives
+    one JSON result per analysed frame. Frames that arrive while an analysis
+    is running replace each other, so only the newest one is analysed next.
+    ?quality= selects the tier as for /analyze-face.
+
+    CORS does not cover websockets, so browsers connecting from an origin
+    outside ALLOWED_ORIGINS are refused before the handshake completes.
+    Text messages end the stream with an error and close code 1003.
+    """
+    origin = websocket.headers.get("origin")
+    if origin is not None and origin not in ALLOWED_ORIGINS:
+        logger.warning(f"Analysis stream from origin {origin} refused")
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    quality = websocket.query_params.get("quality", "auto")
+    if not valid_quality(quality):
+        await websocket.send_json({"status": "error", "detail": f"quality must be auto or one of {QUALITY_TIERS}"})
+        await websocket.close(code=1008)
+        return
+    slot = LatestFrameSlot()
+    # Each stream is one tracking session; clients may resume one with ?session_id=
+    session = session_registry.get(websocket.query_params.get("session_id"))
+
+    async def receive_frames() -> None:
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    break
+                frame = message.get("bytes")
+                if frame is None:
+                    await websocket.send_json({"status": "error", "detail": "Frames must be sent as binary messages"})
+                    await websocket.close(code=1003)
+                    break
+                if len(frame) > MAX_IMAGE_SIZE:
+                    await websocket.send_json({
+                        "status": "error",
+                        "detail": "Image size exceeds maximum allowed size (10MB)"
+                    })
+                    continue
+                slot.put(frame)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            slot.close()
+
+    receiver = asyncio.create_task(receive_frames())
+    logger.info("Analysis stream opened")
+
+    try:
+        while True:
+            frame = await slot.take()
+            if frame is None:
+                if slot.closed:
+                    break
+                continue
+
+            start_time = time.time()
+            # Re-register the stream if the registry evicted its session while it was idle
+            session = session_registry.get(session.session_id)
+            try:
+                async with admission.admit(session.session_id):
+                    quality_governor.observe(time.time() - start_time)
+                    img = await run_blocking(decode_image, frame)
+                    result = await analyze_frame(img, len(frame), start_time, session, quality)
+            except ServerOverloaded as e:
+                # The frame is dropped; the client simply sends newer ones
+                admission_rejections.labels(e.reason).inc()
+                result = {"status": "busy", "detail": str(e), "retry_after": e.retry_after}
+            except Exception as e:
+                errors.labels("stream").inc()
+                logger.error(f"Error during streamed face analysis: {str(e)}")
+                result = {"status": "error", "detail": f"Face analysis failed: {str(e)}"}
+
+            result["session_id"] = session.session_id
+            result["frames_received"] = slot.received
+            result["frames_dropped"] = slot.dropped
+            await websocket.send_json(result)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+        logger.info(f"Analysis stream closed after {slot.received} frames ({slot.dropped} dropped)")
+
+async def backfill_embeddings(person_dirs: List[Path]) -> None:
+    """Compute embeddings for enrollments made before embeddings were stored"""
+    for person_dir in person_dirs:
+        try:
+            logger.info(f"Computing missing embedding for {person_dir.name}")
+            embedding = await run_inference(compute_embedding, str(person_dir / REFERENCE_IMAGE_NAME))
+            await run_blocking(np.save, person_dir / EMBEDDINGS_FILE_NAME, embedding[np.newaxis])
+            face_gallery.add(person_dir.name, embedding)
+        except Exception as e:
+            logger.warning(f"Error computing embedding for {person_dir}: {str(e)}")
+
+    if person_dirs:
+        face_catalog.follow_publish(*face_gallery.publish())
+
+async def warm_up_server() -> None:
+    """Build and warm every model, then load the face gallery, and mark the server ready"""
+    loop = asyncio.get_running_loop()
+    try:
+        if INFERENCE_WORKER_PROCESSES > 0:
+            # Workers build their models in the pool initializer and only take tasks
+            # afterwards, so keep polling until every worker process has answered
+            workers = {}
+            while len(workers) < INFERENCE_WORKER_PROCESSES:
+                statuses = await asyncio.gather(*[
+                    loop.run_in_executor(inference_executor, inference.worker_status, 0.2)
+                    for _ in range(INFERENCE_WORKER_PROCESSES)
+                ])
+                workers.update({status["pid"]: status for status in statuses})
+            startup_state["workers"] = list(workers.values())
+            # DeepFace is only imported in the workers; adopt their verdict
+            inference.DEEPFACE_AVAILABLE = all(status["deepface_available"] for status in workers.values())
+        else:
+            await loop.run_in_executor(inference_executor, inference.prepare_models, FACE_DETECTION_MODELS)
+            startup_state["workers"] = [inference.worker_status()]
+
+        missing = await run_blocking(face_gallery.load, ensure_directories())
+        await run_blocking(face_catalog.load, KNOWN_FACES_DIR)
+        if inference.DEEPFACE_AVAILABLE:
+            await backfill_embeddings(missing)
+
+        startup_state["ready"] = True
+        logger.info("Server is ready to accept traffic")
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.error(f"Server warm-up failed: {str(e)}")
+
+@app.on_event("startup")
+async def start_warm_up() -> None:
+    """Start the warm-up in the background so /health can answer while models load"""
+    app.state.warm_up_task = asyncio.create_task(warm_up_server())
+
 def initialize_server() -> None:
     """
     Initialize server with necessary setup, validation, and encryption
@@ -944,7 +2621,14 @@ def initialize_server() -> None:
         logger.info(f"- Minimum face size: {MIN_FACE_SIZE}")
         logger.info(f"- Available detection models: {FACE_DETECTION_MODELS}")
         logger.info(f"- Encryption enabled: {True}")
-        logger.info(f"- DeepFace available: {DEEPFACE_AVAILABLE}")
+        logger.info(f"- DeepFace available: {inference.DEEPFACE_AVAILABLE}")
+        logger.info(f"- Mock inference: {MOCK_INFERENCE}")
+        logger.info(f"- Admission: {ANALYSIS_MAX_IN_FLIGHT} in flight, {ANALYSIS_MAX_QUEUED} queued, "
+                    f"{ANALYSIS_MAX_PER_CLIENT} per session")
+        logger.info(f"- Quality: default tier {ANALYSIS_DEFAULT_TIER}, queue target {QUALITY_QUEUE_TARGET_MS}ms")
+        logger.info(f"- Inference pool size: {INFERENCE_POOL_SIZE}, queue depth: {INFERENCE_QUEUE_DEPTH}")
+        logger.info(f"- Inference worker processes: {INFERENCE_WORKER_PROCESSES or 'disabled'}")
+        logger.info(f"- Max detection dimension: {MAX_DETECTION_DIMENSION or 'full resolution'}")
 
     except Exception as e:
         logger.error(f"Server initialization failed: {str(e)}")
@@ -962,7 +2646,8 @@ if __name__ == "__main__":
             port=8000,
             log_level="info",
             access_log=True,
-            workers=1  # For facial recognition, single worker is more stable
+            # A single serving process; set INFERENCE_WORKER_PROCESSES to spread inference across cores
+            workers=1
         )
     except Exception as e:
         print(f"Failed to start server: {str(e)}")
@@ -98,12 +98,16 @@ export const api = {
   /**
    * Analyze a face image
    * @param {File} file - The image file to analyze
+   * @param {string} [sessionId] - Stable id of the calling camera, for face tracking and per-client fairness
    * @returns {Promise} - Resolves with the analysis results
    */
-  async analyzeFace(file) {
+  async analyzeFace(file, sessionId) {
     try {
       const formData = new FormData();
       formData.append('file', file);
+      if (sessionId) {
+        formData.append('session_id', sessionId);
+      }
 
       const response = await fetch(`${API_BASE_URL}/analyze-face`, {
         method: 'POST',
@@ -115,5 +119,29 @@ export const api = {
       console.error('Error analyzing face:', error);
       throw error;
     }
+  },
+
+  /**
+   * Open a persistent analysis stream for continuous camera frames
+   * @param {Function} onResult - Called with each analysis result
+   * @returns {Object} - { sendFrame(blob), close() }
+   */
+  openAnalysisStream(onResult) {
+    const socket = new WebSocket(`${API_BASE_URL.replace(/^http/, 'ws')}/ws/analyze`);
+    socket.binaryType = 'arraybuffer';
+    socket.onmessage = (event) => onResult(JSON.parse(event.data));
+    socket.onerror = (error) => console.error('Analysis stream error:', error);
+
+    return {
+      // The server only analyses the newest frame, so frames can be sent as often as they are captured
+      sendFrame(blob) {
+        if (socket.readyState === WebSocket.OPEN) {
+          socket.send(blob);
+        }
+      },
+      close() {
+        socket.close();
+      }
+    };
   }
 };
\ No newline at end of file
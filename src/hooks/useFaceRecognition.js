@@ -1,4 +1,5 @@
 import { useState, useCallback, useRef } from 'react';
+import { generateSessionId } from '../utils/helpers';
 
 /**
  * Custom hook for handling face recognition and emotion analysis
@@ -9,6 +10,8 @@ const useFaceRecognition = () => {
   const [isProcessing, setIsProcessing] = useState(false);
   // Track any errors that occur during processing
   const [error, setError] = useState(null);
+  // Stable id for this camera, so the server tracks faces and shares load per kiosk rather than per address
+  const sessionIdRef = useRef(generateSessionId());
 
   /**
    * Converts a data URL to a Blob object
@@ -102,6 +105,7 @@ const useFaceRecognition = () => {
       // Prepare the form data for upload
       const formData = new FormData();
       formData.append('file', blob, 'face.jpg');
+      formData.append('session_id', sessionIdRef.current);
 
       // Send the image to the server for processing
       const response = await fetch('http://localhost:8000/analyze-face', {